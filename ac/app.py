@@ -1,14 +1,32 @@
 from dash import Dash, html, dcc
 import dash_bootstrap_components as dbc
+import diskcache
+
+from constants import JOB_CACHE_FOLDER
 from layout import add_layout
-from callbacks import add_callbacks
+from callbacks import add_callbacks, job_source
+from routes import add_routes
 from runtime_manager import Control
+from job_pool import PooledDiskcacheManager
+
+# Slow callbacks run as background jobs on a few long-lived worker processes, with their
+# queue, progress and results on local disk.
+background_callback_manager = PooledDiskcacheManager(
+    diskcache.Cache(JOB_CACHE_FOLDER), affinity=job_source
+)
+app = Dash(
+    __name__,
+    external_stylesheets=[dbc.themes.BOOTSTRAP],
+    background_callback_manager=background_callback_manager,
+)
 
-app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# For WSGI servers, e.g. gunicorn --threads 8 app:server
+server = app.server
 
 control: Control = Control()
 add_layout(app, control)
 add_callbacks(app, control)
+add_routes(app)
 
 if __name__ == "__main__":
     app.run(debug=False)
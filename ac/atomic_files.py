@@ -0,0 +1,39 @@
+"""Write files through a temp file and a rename, so readers never see half of one."""
+
+from typing import Iterator, Union
+from pathlib import Path
+from contextlib import contextmanager, suppress
+import os
+import tempfile
+
+# Permissions of written files (mkstemp makes them private to the owner).
+FILE_MODE: int = 0o644
+
+
+@contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """
+    A temp path of its own next to path, for the caller to write; renamed over path when
+    the block finishes, removed if it raises. Concurrent writers of the same path never
+    share a temp file, and the last rename wins.
+    """
+    fd, temp_name = tempfile.mkstemp(
+        dir=path.parent, prefix=path.name + ".", suffix=".part"
+    )
+    os.close(fd)
+    try:
+        yield Path(temp_name)
+        os.chmod(temp_name, FILE_MODE)
+        os.replace(temp_name, path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(temp_name)
+        raise
+
+
+def write_atomic(path: Path, data: Union[bytes, str]):
+    with atomic_path(path) as temp_path:
+        if isinstance(data, str):
+            temp_path.write_text(data)
+        else:
+            temp_path.write_bytes(data)
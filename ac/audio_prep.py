@@ -1,45 +1,437 @@
 """Preprocess the audio files into smaller pieces for a quicker loading time."""
 
-from typing import List
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from pathlib import Path
+from concurrent.futures import Future, ProcessPoolExecutor
+from subprocess import Popen, PIPE
+import threading
+import argparse
 
 import tqdm
 import numpy as np
 import pydub
 from pydub import AudioSegment
+from pydub.utils import mediainfo
 
-from constants import ASSET_FOLDER, SPLIT_INTERVAL
+from constants import ASSET_FOLDER, PROCESSED_FOLDER, CHUNK_CODEC
+from atomic_files import atomic_path
+from pcm_store import write_pcm, write_pcm_blocks, has_pcm
+from frame_index import encode_source, build_index, has_index
+from peaks import PeakBuilder, write_peaks
+from manifest import (
+    source_hash,
+    new_manifest,
+    load_manifest,
+    save_manifest,
+    is_current,
+    split_interval_for,
+)
 
 
 test_files: List[str] = ["2011_audio.m4a", "2012_audio.m4a", "2023_audio.m4a"]
 
 
-def splitter(sound, sound_name):
-    """Split a large file into smaller ones."""
-    offset = 0
-    file_index = 0
+def chunk_path(
+    sound_name: str,
+    file_index: int,
+    interval: Optional[int] = None,
+    folder: Path = PROCESSED_FOLDER,
+) -> Path:
+    if interval is None:
+        interval = split_interval_for(sound_name)
+    return folder.joinpath("{}_{}_{}.mp3".format(sound_name, file_index, interval))
+
+
+def export_chunk(sound: AudioSegment, path: Path):
+    """Encode a chunk aside and rename it into place, so none is ever half written."""
+    with atomic_path(path) as temp_path:
+        sound.export(temp_path, **CHUNK_CODEC)
+
+
+def first_missing_chunk(sound_name: str, chunk_count: int) -> int:
+    for file_index in range(chunk_count):
+        if not chunk_path(sound_name, file_index).is_file():
+            return file_index
+    return chunk_count
+
+
+def splitter(
+    sound,
+    sound_name,
+    first_index: int = 0,
+    interval: Optional[int] = None,
+    folder: Path = PROCESSED_FOLDER,
+):
+    """
+    Split a large file into smaller ones, starting from the first_index-th piece. Pieces
+    are interval ms long, the length configured for the source by default.
+    """
+    if interval is None:
+        interval = split_interval_for(sound_name)
+    offset = first_index * interval
+    file_index = first_index
     l = len(sound)
 
     print(f"Cutting {sound_name} into smaller pieces...")
-    for _ in tqdm.tqdm(range(0, l, SPLIT_INTERVAL)):
-        end = min(l, offset + SPLIT_INTERVAL)
+    for _ in tqdm.tqdm(range(offset, l, interval)):
+        end = min(l, offset + interval)
         temp = sound[offset:end]
         offset = end
 
-        temp.export(
-            ASSET_FOLDER.joinpath(
-                "processed/{}_{}_{}.mp3".format(
-                    sound_name, file_index, SPLIT_INTERVAL
-                ),
-            ),
-            format="mp3",
-        )
+        export_chunk(temp, chunk_path(sound_name, file_index, interval, folder))
 
         file_index += 1
 
 
-for test_file in test_files:
-    splitter(
-        AudioSegment.from_file(ASSET_FOLDER.joinpath(test_file)),
-        test_file
+def stream_chunks(sound_name: str, first_index: int = 0) -> Iterator[AudioSegment]:
+    """
+    Decode a source through an ffmpeg pipe and yield it one chunk-long piece at a time,
+    starting from the first_index-th piece. Only one piece of raw samples is held in
+    memory, whatever the length of the source. Pieces match the ones splitter cuts.
+    """
+    path: Path = ASSET_FOLDER.joinpath(sound_name)
+    interval: int = split_interval_for(sound_name)
+    info: Dict[str, Any] = mediainfo(str(path))
+    frame_rate: int = int(info["sample_rate"])
+    channels: int = int(info["channels"])
+    sample_width: int = 2
+    frame_width: int = channels * sample_width
+
+    # Seeking makes the decoder start cold (primed with silence) at the seek point, so a
+    # fresh run decodes from the start to match splitter; only resumed runs seek.
+    seek: List[str] = (
+        ["-ss", str(first_index * interval / 1000)] if first_index > 0 else []
     )
+    process = Popen(
+        [
+            AudioSegment.converter,
+            "-v",
+            "error",
+            *seek,
+            "-i",
+            str(path),
+            "-f",
+            "s16le",
+            "-acodec",
+            "pcm_s16le",
+            "-ar",
+            str(frame_rate),
+            "-ac",
+            str(channels),
+            "-",
+        ],
+        stdout=PIPE,
+        stderr=PIPE,
+    )
+
+    file_index: int = first_index
+    while True:
+        # Same frame boundaries as slicing the whole decoded source by milliseconds.
+        frames: int = int((file_index + 1) * interval * frame_rate / 1000) - int(
+            file_index * interval * frame_rate / 1000
+        )
+        data: bytes = process.stdout.read(frames * frame_width)
+        if len(data) < frame_width:
+            break
+        yield AudioSegment(
+            data=data[: len(data) // frame_width * frame_width],
+            sample_width=sample_width,
+            frame_rate=frame_rate,
+            channels=channels,
+        )
+        file_index += 1
+
+    process.stdout.close()
+    if process.wait() != 0:
+        raise RuntimeError(
+            f"Decoding {sound_name} failed: {process.stderr.read().decode()}"
+        )
+
+
+def stream_duration(sound_name: str) -> int:
+    """Length of a source in ms, from its metadata."""
+    return int(
+        float(mediainfo(str(ASSET_FOLDER.joinpath(sound_name)))["duration"]) * 1000
+    )
+
+
+def stream_splitter(
+    sound_name: str, first_index: int = 0, peaks: Optional[PeakBuilder] = None
+) -> int:
+    """
+    Streaming counterpart of splitter, adding the streamed pieces to peaks if given.
+    Returns the decoded length of the source in ms.
+    """
+    interval: int = split_interval_for(sound_name)
+    l = first_index * interval
+    total = len(range(l, stream_duration(sound_name), interval))
+    chunks: Iterator[AudioSegment] = stream_chunks(sound_name, first_index)
+
+    print(f"Cutting {sound_name} into smaller pieces...")
+    for file_index, temp in enumerate(
+        tqdm.tqdm(chunks if peaks is None else peaks.watch(chunks), total=total),
+        start=first_index,
+    ):
+        export_chunk(temp, chunk_path(sound_name, file_index))
+        l += len(temp)
+    return l
+
+
+def _export_chunk(
+    data: bytes, sample_width: int, frame_rate: int, channels: int, path: Path
+) -> Path:
+    """Pool worker: encode one chunk of raw samples."""
+    export_chunk(
+        AudioSegment(
+            data=data,
+            sample_width=sample_width,
+            frame_rate=frame_rate,
+            channels=channels,
+        ),
+        path,
+    )
+    return path
+
+
+def start_source(sound_name: str, layout: str) -> Optional[Dict[str, Any]]:
+    """
+    Compare a source against its manifest. Returns None if it is already processed,
+    otherwise the state to (re)process it with; "first_index" tells where an
+    interrupted run stopped.
+    """
+    content_hash: str = source_hash(ASSET_FOLDER.joinpath(sound_name))
+    manifest: Optional[Dict[str, Any]] = load_manifest(sound_name)
+    current: bool = is_current(manifest, content_hash, layout)
+
+    if current and manifest["complete"]:
+        if layout == "pcm":
+            done: bool = has_pcm(sound_name)
+        elif layout == "indexed":
+            done = has_index(sound_name)
+        else:
+            done = (
+                first_missing_chunk(sound_name, manifest["chunk_count"])
+                == manifest["chunk_count"]
+            )
+        if done:
+            print(f"{sound_name} is up to date, skipped.")
+            return None
+
+    first_index: int = 0
+    if current and layout == "mp3":
+        first_index = first_missing_chunk(sound_name, manifest["chunk_count"])
+    return {"content_hash": content_hash, "first_index": first_index}
+
+
+def begin_manifest(
+    sound_name: str, duration: int, state: Dict[str, Any], layout: str
+) -> Dict[str, Any]:
+    interval: int = split_interval_for(sound_name)
+    manifest: Dict[str, Any] = new_manifest(
+        sound_name,
+        content_hash=state["content_hash"],
+        layout=layout,
+        duration=duration,
+        chunk_count=len(range(0, duration, interval)) if layout == "mp3" else 1,
+        split_interval=interval,
+    )
+    save_manifest(manifest)
+    return manifest
+
+
+def finish_manifest(manifest: Dict[str, Any], duration: Optional[int] = None):
+    """
+    Mark a source done. Streamed sources pass their decoded length, which may differ a
+    little from the one in their metadata.
+    """
+    if duration is not None:
+        manifest["duration"] = duration
+        if manifest["layout"] == "mp3":
+            manifest["chunk_count"] = len(
+                range(0, duration, manifest["split_interval"])
+            )
+    manifest["complete"] = True
+    save_manifest(manifest)
+
+
+def index_source(sound_name: str, peaks: Optional[PeakBuilder] = None) -> int:
+    """
+    Encode a source into a single mp3 and index its frames, adding its samples to peaks
+    if given. Returns the length of the source in ms.
+    """
+    print(f"Encoding and indexing {sound_name}...")
+    encode_source(sound_name, peaks=peaks)
+    index: Dict[str, Any] = build_index(sound_name)
+    samples: int = len(index["timestamps"]) * int(index["samples_per_frame"]) - int(
+        index["skip"]
+    )
+    return round(1000 * samples / int(index["frame_rate"]))
+
+
+def peaks_for(sound_name: str, sound: Optional[AudioSegment] = None):
+    """Build the waveform pyramid of a source, from its decoded samples if at hand."""
+    write_peaks([sound] if sound is not None else stream_chunks(sound_name), sound_name)
+
+
+def stream_peaks(first_index: int) -> Optional[PeakBuilder]:
+    """
+    Pyramid to fill while a source streams by, so it is not decoded again for it.
+    Resumed runs only stream the rest of the source, and use peaks_for afterwards.
+    """
+    return PeakBuilder() if first_index == 0 else None
+
+
+def save_stream_peaks(sound_name: str, peaks: Optional[PeakBuilder]):
+    if peaks is None:
+        peaks_for(sound_name)
+    else:
+        peaks.save(sound_name)
+
+
+def parallel_splitter(sound_names: List[str], workers: int, stream: bool = False):
+    """
+    Split several sources at once, encoding their chunks on a pool of processes. Chunk
+    names only depend on their position in the source, so the output is the same as
+    running splitter on each source in turn.
+    """
+    pending: List[Tuple[Dict[str, Any], List[Future], List[int]]] = []
+    progress = tqdm.tqdm(total=0, unit="chunk")
+    # When streaming, bound the raw chunks waiting for a worker to keep memory flat.
+    in_flight = threading.BoundedSemaphore(2 * workers)
+
+    def chunk_done(_):
+        progress.update(1)
+        if stream:
+            in_flight.release()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Decoding the next source overlaps with encoding the chunks of previous ones.
+        for sound_name in sound_names:
+            state: Optional[Dict[str, Any]] = start_source(sound_name, "mp3")
+            if state is None:
+                continue
+            first_index: int = state["first_index"]
+            interval: int = split_interval_for(sound_name)
+            peaks: Optional[PeakBuilder] = stream_peaks(first_index) if stream else None
+            if stream:
+                duration: int = stream_duration(sound_name)
+                chunks: Iterator[AudioSegment] = stream_chunks(sound_name, first_index)
+                if peaks is not None:
+                    chunks = peaks.watch(chunks)
+            else:
+                sound: AudioSegment = AudioSegment.from_file(
+                    ASSET_FOLDER.joinpath(sound_name)
+                )
+                duration = len(sound)
+                chunks = (
+                    sound[offset : min(duration, offset + interval)]
+                    for offset in range(first_index * interval, duration, interval)
+                )
+            manifest: Dict[str, Any] = begin_manifest(
+                sound_name, duration, state, "mp3"
+            )
+            progress.total += len(range(first_index * interval, duration, interval))
+            progress.set_description(sound_name)
+            progress.refresh()
+
+            futures: List[Future] = []
+            lengths: List[int] = [first_index * interval]
+            for file_index, temp in enumerate(chunks, start=first_index):
+                if stream:
+                    in_flight.acquire()
+                future: Future = pool.submit(
+                    _export_chunk,
+                    temp.raw_data,
+                    temp.sample_width,
+                    temp.frame_rate,
+                    temp.channels,
+                    chunk_path(sound_name, file_index),
+                )
+                future.add_done_callback(chunk_done)
+                futures.append(future)
+                lengths.append(len(temp))
+            pending.append((manifest, futures, lengths))
+            if stream:
+                save_stream_peaks(sound_name, peaks)
+            else:
+                peaks_for(sound_name, sound)
+
+        # Surface any encoding error, and only mark sources whose chunks all made it.
+        for manifest, futures, lengths in pending:
+            for future in futures:
+                future.result()
+            finish_manifest(manifest, duration=sum(lengths) if stream else None)
+    progress.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--pcm",
+        action="store_true",
+        help="Decode each source once into a raw sample file instead of mp3 chunks.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes encoding mp3 chunks in parallel.",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Decode sources through a pipe piece by piece instead of all at once.",
+    )
+    parser.add_argument(
+        "--indexed",
+        action="store_true",
+        help="Encode each source into one mp3 with a frame index instead of chunks.",
+    )
+    args = parser.parse_args()
+    layout: str = "pcm" if args.pcm else "indexed" if args.indexed else "mp3"
+
+    if args.indexed:
+        # ffmpeg streams the source itself here, so --stream changes nothing.
+        for test_file in test_files:
+            state: Optional[Dict[str, Any]] = start_source(test_file, layout)
+            if state is None:
+                continue
+            manifest: Dict[str, Any] = begin_manifest(test_file, 0, state, layout)
+            peaks: PeakBuilder = PeakBuilder()
+            duration: int = index_source(test_file, peaks)
+            peaks.save(test_file)
+            finish_manifest(manifest, duration=duration)
+    elif args.workers > 1 and not args.pcm:
+        parallel_splitter(test_files, args.workers, stream=args.stream)
+    else:
+        for test_file in test_files:
+            state: Optional[Dict[str, Any]] = start_source(test_file, layout)
+            if state is None:
+                continue
+            if args.stream:
+                manifest: Dict[str, Any] = begin_manifest(
+                    test_file, stream_duration(test_file), state, layout
+                )
+                peaks: Optional[PeakBuilder] = stream_peaks(state["first_index"])
+                if args.pcm:
+                    # The sample store is always written whole.
+                    peaks = PeakBuilder()
+                    duration: int = write_pcm_blocks(
+                        peaks.watch(stream_chunks(test_file)), test_file
+                    )
+                else:
+                    duration = stream_splitter(test_file, state["first_index"], peaks)
+                save_stream_peaks(test_file, peaks)
+                finish_manifest(manifest, duration=duration)
+                continue
+
+            sound: AudioSegment = AudioSegment.from_file(
+                ASSET_FOLDER.joinpath(test_file)
+            )
+            manifest = begin_manifest(test_file, len(sound), state, layout)
+            if args.pcm:
+                write_pcm(sound, test_file)
+            else:
+                splitter(sound, test_file, first_index=state["first_index"])
+            peaks_for(test_file, sound)
+            finish_manifest(manifest)
@@ -0,0 +1,306 @@
+"""
+Benchmark the cut pipeline on synthetic sources of several lengths and record stores of
+several sizes, and write the timings as json so runs can be compared. Everything runs in
+a scratch folder; the app's assets are left alone.
+
+Usage: python benchmark.py --minutes 10 40 --records 100 1000 10000 --output bench.json
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pathlib import Path
+import argparse
+import datetime
+import json
+import platform
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from pydub import AudioSegment
+
+from constants import SPLIT_INTERVAL
+from chunk_cache import CHUNK_CACHE
+from chunk_tuning import synthetic_source, prepare_source
+from timefmt import formatter_lv0
+from cutter import file_finder, cut_audio, cut_record
+from runtime_manager import Control
+from record_store import RecordStore
+from utils import generate_preview, plot_preview
+
+# Length of the cuts timed, in ms; multi-chunk cuts span three chunks.
+CUT_LENGTH: int = 3000
+MULTI_CUT_LENGTH: int = 2 * SPLIT_INTERVAL + CUT_LENGTH
+# Words the quotes of filler records are made of.
+VOCABULARY: List[
+    str
+] = "the of lecture energy wave quantum field time space light".split()
+
+
+def summarize(latencies: List[float]) -> Dict[str, Any]:
+    latencies_ms: np.ndarray = np.array(latencies)
+    return {
+        "runs": len(latencies),
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p90_ms": float(np.percentile(latencies_ms, 90)),
+        "min_ms": float(latencies_ms.min()),
+        "max_ms": float(latencies_ms.max()),
+    }
+
+
+def timed(
+    function: Callable[[int], Any], runs: int, setup: Optional[Callable[[], Any]] = None
+) -> Dict[str, Any]:
+    """Time function(run) for each run, each after an untimed setup() if given."""
+    latencies: List[float] = []
+    for run in range(runs):
+        if setup is not None:
+            setup()
+        tic: float = time.perf_counter()
+        function(run)
+        latencies.append((time.perf_counter() - tic) * 1000)
+    return summarize(latencies)
+
+
+def time_str(start: int, end: int) -> str:
+    """Time string of a cut, as typed in the app."""
+    return "-".join(
+        "{:02d}:{:02d}:{:03d}".format(*Control.split_ms(ms)) for ms in (start, end)
+    )
+
+
+def random_cuts(
+    duration: int, length: int, runs: int, seed: int = 0
+) -> List[Tuple[int, int]]:
+    """runs random cuts of length ms, each covering as few chunks as it can."""
+    rng = np.random.default_rng(seed)
+    chunks: int = (duration - length) // SPLIT_INTERVAL
+    cuts: List[Tuple[int, int]] = []
+    for _ in range(runs):
+        start: int = int(rng.integers(chunks)) * SPLIT_INTERVAL
+        start += int(rng.integers(max(1, SPLIT_INTERVAL - length % SPLIT_INTERVAL)))
+        cuts.append((start, start + length))
+    return cuts
+
+
+def bench_parsing(runs: int) -> List[Dict[str, Any]]:
+    strings: List[str] = [
+        time_str(run * 1000, run * 1000 + CUT_LENGTH) for run in range(runs)
+    ]
+    return [
+        {
+            "name": "formatter_lv0",
+            **timed(lambda run: formatter_lv0(strings[run]), runs),
+        },
+    ]
+
+
+def bench_preview(sound: AudioSegment, runs: int) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    for length in [CUT_LENGTH, 30000]:
+        clip: AudioSegment = sound[:length]
+        results.append(
+            {
+                "name": "generate_preview",
+                "cut_length": length,
+                **timed(lambda run: generate_preview(clip), runs),
+            }
+        )
+    return results
+
+
+def bench_source(
+    sound: AudioSegment, video_name: str, root: Path, runs: int, seed: int = 0
+) -> List[Dict[str, Any]]:
+    """Cold cuts (no chunk nor render cache) of a source in root/assets/processed."""
+    sound_name: str = video_name + "_audio.m4a"
+    folder: Path = root.joinpath("assets/processed")
+    cache_folder: Path = root.joinpath("assets/renders")
+    output_path: Path = root.joinpath("cut.mp3")
+    params: Dict[str, Any] = {
+        "minutes": len(sound) // 60000,
+        "interval": SPLIT_INTERVAL,
+    }
+
+    def cold():
+        CHUNK_CACHE.clear()
+        shutil.rmtree(cache_folder, ignore_errors=True)
+
+    results: List[Dict[str, Any]] = []
+    for span, length in [
+        ("single_chunk", CUT_LENGTH),
+        ("multi_chunk", MULTI_CUT_LENGTH),
+    ]:
+        cuts: List[Tuple[int, int]] = random_cuts(len(sound), length, runs, seed)
+        results.append(
+            {
+                "name": "file_finder",
+                "span": span,
+                **params,
+                **timed(
+                    lambda run: file_finder(*cuts[run], sound_name, folder), runs, cold
+                ),
+            }
+        )
+        results.append(
+            {
+                "name": "cut_audio",
+                "span": span,
+                **params,
+                **timed(
+                    lambda run: cut_audio(
+                        video_name,
+                        time_str(*cuts[run]),
+                        quote="",
+                        title="",
+                        mono=False,
+                        edits=0,
+                        output_path=output_path,
+                        folder=folder,
+                        cache_folder=cache_folder,
+                    ),
+                    runs,
+                    cold,
+                ),
+            }
+        )
+    return results
+
+
+def bench_control(
+    duration: int,
+    video_name: str,
+    root: Path,
+    sizes: List[int],
+    runs: int,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """Submitting and loading records as the store of a Control over root grows."""
+    rng = np.random.default_rng(seed)
+    record_db: Path = root.joinpath("records.sqlite3")
+    # Nothing to import: marks the scratch store as migrated, so no legacy records join.
+    RecordStore(record_db).migrate(root.joinpath("none"), root.joinpath("none"))
+    control: Control = Control(parent=root, record_db=record_db)
+
+    def cold():
+        CHUNK_CACHE.clear()
+        shutil.rmtree(root.joinpath("assets/renders"), ignore_errors=True)
+
+    results: List[Dict[str, Any]] = []
+    filled: int = 0
+    for size in sorted(sizes):
+        for start, end in random_cuts(duration, CUT_LENGTH, size - filled, seed + size):
+            entry: Dict[str, Any] = cut_record(
+                video_name,
+                time_str(start, end),
+                quote=" ".join(rng.choice(VOCABULARY, 8)),
+                title=f"filler{filled}",
+                edits=0,
+            )
+            control.store.add(entry)
+            filled += 1
+
+        cuts: List[Tuple[int, int]] = random_cuts(duration, CUT_LENGTH, runs, seed)
+        saved: List[str] = []
+
+        def add_entry(run: int):
+            entry: Dict[str, Any] = cut_record(
+                video_name, time_str(*cuts[run]), "", f"bench{size}_{run}", 0
+            )
+            saved.append(control.add_entry(entry)[1])
+
+        indices: np.ndarray = rng.integers(filled, size=runs)
+        results += [
+            {
+                "name": "Control.add_entry",
+                "records": size,
+                **timed(add_entry, runs, cold),
+            },
+            {
+                "name": "Control.load_entry",
+                "records": size,
+                **timed(lambda run: control.load_entry(int(indices[run])), runs),
+            },
+            {
+                "name": "load_plot",
+                "records": size,
+                **timed(
+                    lambda run: plot_preview(control.saved_peaks(saved[run])), runs
+                ),
+            },
+        ]
+        filled += runs
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--minutes",
+        type=int,
+        nargs="+",
+        default=[10, 40],
+        help="Lengths of the sources.",
+    )
+    parser.add_argument(
+        "--records",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000],
+        help="Record store sizes to submit and load at.",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=20, help="Timed runs per benchmark."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=Path("benchmark.json"))
+    args = parser.parse_args()
+    # Room for a multi-chunk cut starting anywhere in the first chunk.
+    shortest: int = -(-(MULTI_CUT_LENGTH + SPLIT_INTERVAL) // 60000)
+    if min(args.minutes) < shortest:
+        parser.error(f"--minutes must be at least {shortest}.")
+
+    results: List[Dict[str, Any]] = bench_parsing(args.runs * 50)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root: Path = Path(temp_dir)
+        for minutes in sorted(args.minutes):
+            video_name: str = f"synthetic{minutes}"
+            sound: AudioSegment = synthetic_source(minutes * 60 * 1000, seed=args.seed)
+            folder: Path = root.joinpath("assets/processed")
+            folder.mkdir(parents=True, exist_ok=True)
+            prepare_source(sound, video_name + "_audio.m4a", SPLIT_INTERVAL, folder)
+            results += bench_source(sound, video_name, root, args.runs, args.seed)
+        # Records cut from the longest source.
+        results += bench_preview(sound, args.runs)
+        results += bench_control(
+            len(sound), video_name, root, args.records, args.runs, args.seed
+        )
+
+    for result in results:
+        labels: str = " ".join(
+            f"{key}={value}"
+            for key, value in result.items()
+            if key != "name" and not key.endswith("_ms") and key != "runs"
+        )
+        print(
+            f"{result['name']:<20} {labels:<32} "
+            f"mean {result['mean_ms']:9.2f}  p50 {result['p50_ms']:9.2f}  "
+            f"p90 {result['p90_ms']:9.2f}  (ms)"
+        )
+    report: Dict[str, Any] = {
+        "environment": environment(),
+        "settings": {**vars(args), "output": str(args.output)},
+        "results": results,
+    }
+    json.dump(report, open(args.output, "w"), indent=2)
@@ -1,15 +1,43 @@
 """Callbacks for the app."""
-from typing import Any, Dict, List, Tuple
-from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from io import BytesIO
+import json
 
-from dash import Dash, html, dcc, Input, Output, State, callback, dash_table
+from dash import Dash, html, dcc, Input, Output, State, callback, ctx
 from dash.exceptions import PreventUpdate
 from pydub import AudioSegment
+from plotly.utils import PlotlyJSONEncoder
 
 from constants import VIDEOS, OUTPUT_FOLDER
-from utils import timestamp_check, generate_preview, get_empty_figure
-from runtime_manager import Control, EntryNotFoundError
-from cutter import cut_audio, CutError
+from utils import (
+    timestamp_check,
+    parse_table_filter,
+    generate_preview,
+    plot_preview,
+    generate_overview,
+    get_empty_figure,
+)
+from runtime_manager import Control, EntryNotFoundError, InvalidEntryError
+from timefmt import formatter_lv0
+from cutter import render_clip, cut_record, prefetch_chunks, CutError
+from peaks import has_peaks, peak_range, peaks_duration
+from render_cache import load_preview, save_preview
+from routes import clip_url
+from job_pool import CUT_POOL
+
+
+# Progress steps reported by make_cut.
+CUT_STEPS: int = 3
+# Results shown by the quote search.
+SEARCH_RESULTS: int = 10
+
+
+def job_source(values: Dict[str, Any]) -> Optional[str]:
+    """Source a background job cuts from, given its input and state values."""
+    pending_cut: Optional[Dict[str, Any]] = values.get("pending_cut.data")
+    if pending_cut and pending_cut["record"]:
+        return pending_cut["record"]["Source"]
+    return values.get("video_selection_dropdown.value")
 
 
 def add_callbacks(app: Dash, control: Control):
@@ -17,12 +45,69 @@ def add_callbacks(app: Dash, control: Control):
     def change_video(selected_video_id: int):
         return VIDEOS[str(selected_video_id)]
 
+    @app.callback(
+        Output("overview_plot", "figure"),
+        [
+            Input("video_selection_dropdown", "value"),
+            Input("overview_plot", "relayoutData"),
+        ],
+    )
+    def update_overview(selected_video_id: str, relayout_data: Dict[str, Any]):
+        """Redraw the whole-lecture waveform from the pyramid level fit for the zoom."""
+        sound_name: str = str(selected_video_id) + "_audio.m4a"
+        if not has_peaks(sound_name):
+            return get_empty_figure(height=150, width=600)
+
+        start: int = 0
+        end: int = peaks_duration(sound_name)
+        # Zooming only applies to the current video; switching videos shows all of it.
+        if ctx.triggered_id == "overview_plot" and relayout_data:
+            if "xaxis.range[0]" in relayout_data:
+                start = int(relayout_data["xaxis.range[0]"])
+                end = int(relayout_data["xaxis.range[1]"])
+            elif "xaxis.range" in relayout_data:
+                start, end = [int(x) for x in relayout_data["xaxis.range"]]
+            elif "xaxis.autorange" not in relayout_data:
+                raise PreventUpdate
+
+        return generate_overview(
+            peak_range(sound_name, start, end, max_buckets=600),
+            height=150,
+            width=600,
+            uirevision=sound_name,
+        )
+
+    @app.callback(
+        Output("prefetch_status", "data"),
+        [
+            Input("start_min", "value"),
+            Input("start_sec", "value"),
+            Input("video_selection_dropdown", "value"),
+        ],
+        prevent_initial_call=True,
+    )
+    def prefetch_cut_start(start_min: int, start_sec: int, selected_video_id: str):
+        """
+        Warm the chunks around the start timestamp being typed, so the cut finds them
+        decoded. Runs on the cut worker of the source, whose chunk cache the cut uses.
+        """
+        try:
+            position: int = (int(start_min or 0) * 60 + int(start_sec or 0)) * 1000
+        except ValueError:
+            raise PreventUpdate
+        CUT_POOL.submit(
+            selected_video_id,
+            prefetch_chunks,
+            str(selected_video_id) + "_audio.m4a",
+            position,
+        )
+        raise PreventUpdate
+
     @app.callback(
         [
             Output("preview_string", "children"),
             Output("wave_plot", "figure", allow_duplicate=True),
-            Output("audio_player", "url", allow_duplicate=True),
-            # Output("submission_string", "children")
+            Output("pending_cut", "data"),
         ],
         [Input("cut_button", "n_clicks")],
         [
@@ -36,9 +121,13 @@ def add_callbacks(app: Dash, control: Control):
             State("title_input", "value"),
             State("video_selection_dropdown", "value"),
         ],
-        prevent_initial_call="initial_duplicate",
+        background=True,
+        running=[(Output("cut_button", "disabled"), True, False)],
+        progress=[Output("cut_progress", "value"), Output("cut_progress", "max")],
+        prevent_initial_call=True,
     )
     def make_cut(
+        set_progress: Callable[[Tuple[int, int]], None],
         n_click: int,
         start_min: int,
         start_sec: int,
@@ -51,20 +140,23 @@ def add_callbacks(app: Dash, control: Control):
         video_selected: str,
     ) -> Tuple[str]:
         """
-        Core function. The the following:
+        Core function, run as a background job on the cut worker of the source. The the
+        following:
         1. Input sanity checks.
         2. Cut audio and generate audio file.
         3. Make a plot and push to display.
-        4. Push audio to the player.
+        4. Keep the cut as this session's pending cut, which play_pending points the
+        player to and submit_audio saves.
         """
         # 1. Sanity checks.
+        set_progress((0, CUT_STEPS))
         result: str = "Invalid input"
         quote_input: str = quote_input.split("\n")
         if len(quote_input) != 1:
             return (
                 "Invalid quote input: quote cannot exceed one line.",
                 get_empty_figure(),
-                "",
+                None,
             )
 
         _time_input_list: List[str] = [
@@ -79,72 +171,170 @@ def add_callbacks(app: Dash, control: Control):
         timestamp_error: str = timestamp_check(*time_input_list)
 
         if timestamp_error:  # If an error occurs, this string will not be empty.
-            return timestamp_error, get_empty_figure(), ""
+            return timestamp_error, get_empty_figure(), None
 
         if sum(time_input_list) == 0:
-            return "Timestamps not entered.", get_empty_figure(), ""
+            return "Timestamps not entered.", get_empty_figure(), None
 
-        # 2. Cut audio and create temporary file.
+        # 2. Cut audio into the render cache.
         time_str = "{:02d}:{:02d}:{:03d}-{:02d}:{:02d}:{:03d}".format(*time_input_list)
         quote_input: str = quote_input[0]
         if not quote_input:
-            return "Quote is empty.", get_empty_figure(), ""
+            return "Quote is empty.", get_empty_figure(), None
         if not title_input:
-            return "Title is empty.", get_empty_figure(), ""
+            return "Title is empty.", get_empty_figure(), None
+        set_progress((1, CUT_STEPS))
 
         audio_obj: AudioSegment = None
-        cut_record: Dict[str, Any] = None
+        clip: bytes = b""
+        clip_id: str = ""
 
         try:
-            audio_obj, cut_record = cut_audio(
-                video_name=video_selected,
-                time_str=time_str,
-                quote=quote_input,
-                title=title_input,
-                mono=False,
-                edits=0,
+            audio_obj, clip, clip_id = render_clip(
+                video_name=video_selected, time_str=time_str, mono=False, preview=True
             )
         except CutError:
-            pass
-        temp_path: str = control.update_temp_entry(cut_record)
+            return "Audio cut failed.", get_empty_figure(), None
+        record: Dict[str, Any] = cut_record(
+            video_selected, time_str, quote_input, title_input, edits=0
+        )
+        set_progress((2, CUT_STEPS))
 
         # 3. Make a plot and push to display.
-        # As the second return item.
-        # 4. Push audio to the player.
-        # As the third return item.
+        # Previews of cuts made before come from the render cache; sources with a
+        # waveform pyramid are drawn from it instead of the cut samples.
+        sound_name: str = str(video_selected) + "_audio.m4a"
+        preview = load_preview(clip_id)
+        if preview is None:
+            if has_peaks(sound_name):
+                start, end, _ = formatter_lv0(time_str)
+                peaks: Dict[str, Any] = peak_range(
+                    sound_name, start, end, max_buckets=650
+                )
+                # In ms from the start of the cut and not zoomable, like the previews
+                # drawn from samples.
+                peaks["time"] = peaks["time"] - start
+                preview = generate_overview(peaks, height=180, width=650).update_xaxes(
+                    range=[0, end - start], fixedrange=True
+                )
+            else:
+                # Cuts served by the render cache or frame-copied come back undecoded.
+                if audio_obj is None:
+                    audio_obj = AudioSegment.from_file(BytesIO(clip), format="mp3")
+                preview = generate_preview(
+                    audio_obj=audio_obj,
+                    height=180,
+                    width=650,
+                )
+            # Encoded as Dash encodes figures it sends.
+            save_preview(clip_id, json.dumps(preview, cls=PlotlyJSONEncoder))
+        set_progress((CUT_STEPS, CUT_STEPS))
+        # 4. Pending cut of this session; the player streams it by clip id.
         return (
             "Audio cut successful.",
-            generate_preview(
-                audio_obj=audio_obj,
-                height=180,
-                width=650,
-            ),
-            temp_path,
+            preview,
+            {"record": record, "path": clip_url(clip_id)},
         )
 
+    @app.callback(
+        Output("audio_player", "url", allow_duplicate=True),
+        Input("pending_cut", "data"),
+        prevent_initial_call=True,
+    )
+    def play_pending(pending_cut: Optional[Dict[str, Any]]) -> str:
+        """Point the player to the audio of this session's pending cut."""
+        if not pending_cut:
+            return ""
+        return pending_cut["path"]
+
     @app.callback(
         [
-            Output("record_table", "children", allow_duplicate=True),
-            Output("audio_player", "url", allow_duplicate=True),
+            Output("last_submitted", "data"),
+            Output("pending_cut", "data", allow_duplicate=True),
         ],
         Input("submit_button", "n_clicks"),
+        State("pending_cut", "data"),
+        background=True,
+        running=[(Output("submit_button", "disabled"), True, False)],
         prevent_initial_call=True,
     )
     def submit_audio(
         n_clicks: int,
+        pending_cut: Optional[Dict[str, Any]],
     ):
-        new_url: str = control.add_entry()
-        if new_url == "":
+        """Render the pending cut at full quality and save it, as a background job."""
+        if not pending_cut or pending_cut.get("record") is None:
+            raise PreventUpdate
+        try:
+            new_index, new_url = control.add_entry(pending_cut["record"])
+        except InvalidEntryError:
             raise PreventUpdate
 
         return (
-            dash_table.DataTable(
-                control.df.to_dict("records"),
-                [{"name": i, "id": i} for i in control.df.columns],
-            ),
-            new_url,
+            new_index,
+            # Nothing left to submit, to prevent duplicates; the player plays the save.
+            {"record": None, "path": control.player_url(new_url)},
         )
 
+    @app.callback(
+        Output("search_results", "data"),
+        Input("search_input", "value"),
+        prevent_initial_call=True,
+    )
+    def search_records(query: str):
+        """Rank records by their quote and title through the inverted index."""
+        return [
+            {"Index": r.index, "Title": r.title, "Quotes": r.quote, "Source": r.source}
+            for r in control.store.search(query or "", limit=SEARCH_RESULTS)
+        ]
+
+    @app.callback(
+        Output("load_input", "value"),
+        Input("search_results", "active_cell"),
+        State("search_results", "data"),
+        prevent_initial_call=True,
+    )
+    def pick_search_result(
+        active_cell: Optional[Dict[str, Any]], results: List[Dict[str, Any]]
+    ):
+        if not active_cell:
+            raise PreventUpdate
+        return results[active_cell["row"]]["Index"]
+
+    @app.callback(
+        [
+            Output("record_table_data", "data"),
+            Output("record_table_data", "page_count"),
+        ],
+        [
+            Input("record_table_data", "page_current"),
+            Input("record_table_data", "page_size"),
+            Input("record_table_data", "sort_by"),
+            Input("record_table_data", "filter_query"),
+            Input("last_submitted", "data"),
+        ],
+    )
+    def update_record_table(
+        page_current: int,
+        page_size: int,
+        sort_by: List[Dict[str, str]],
+        filter_query: str,
+        last_submitted: Optional[int],
+    ):
+        """Query only the page shown, sorted and filtered by the record store."""
+        try:
+            rows, count = control.store.page(
+                offset=page_current * page_size,
+                limit=page_size,
+                sort_by=[
+                    (x["column_id"], x["direction"] == "asc") for x in sort_by or []
+                ],
+                filters=parse_table_filter(filter_query),
+            )
+        except ValueError:  # Filters the store cannot run.
+            raise PreventUpdate
+        return rows, max(1, -(-count // page_size))
+
     @app.callback(
         [
             Output("start_min", "value"),
@@ -157,7 +347,7 @@ def add_callbacks(app: Dash, control: Control):
             Output("title_input", "value"),
             Output("video_selection_dropdown", "value"),
             Output("wave_plot", "figure", allow_duplicate=True),
-            Output("audio_player", "url", allow_duplicate=True),
+            Output("pending_cut", "data", allow_duplicate=True),
         ],
         [
             Input("load_button", "n_clicks"),
@@ -179,23 +369,15 @@ def add_callbacks(app: Dash, control: Control):
 
         input_meta: List[str] = None
         new_url: str = ""
+        entry: Dict[str, Any] = None
         try:
-            input_meta, new_url = control.load_entry(index=load_input)
+            input_meta, new_url, entry = control.load_entry(index=load_input)
         except EntryNotFoundError:
             raise PreventUpdate
-        if new_url == "":
-            raise PreventUpdate
-
-        audio_obj: AudioSegment = AudioSegment.from_file(
-            Path(__file__).parent.joinpath(new_url)
-        )
 
+        # Records whose clip is missing load with an empty plot and nothing to play.
         return (
             *input_meta,
-            generate_preview(
-                audio_obj=audio_obj,
-                height=180,
-                width=650,
-            ),
-            new_url,
+            plot_preview(control.saved_peaks(new_url), height=180, width=650),
+            {"record": entry, "path": control.player_url(new_url)},
         )
@@ -0,0 +1,91 @@
+"""Process-level cache of decoded chunks, bounded by their total size."""
+
+from typing import Callable, Dict, Hashable, Optional
+from collections import OrderedDict
+import os
+import threading
+
+from pydub import AudioSegment
+
+from constants import CHUNK_CACHE_BYTES
+
+
+class ChunkCache:
+    """Decoded chunks kept up to max_bytes of raw samples, evicting the least recent."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes: int = max_bytes
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._entries: "OrderedDict[Hashable, AudioSegment]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Membership test that neither counts as a lookup nor refreshes the entry."""
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[AudioSegment]:
+        with self._lock:
+            sound: Optional[AudioSegment] = self._entries.get(key)
+            if sound is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return sound
+
+    def put(self, key: Hashable, sound: AudioSegment):
+        size: int = len(sound.raw_data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key).raw_data)
+            self._entries[key] = sound
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.raw_data)
+                self.evictions += 1
+
+    def get_or_load(
+        self, key: Hashable, loader: Callable[[], AudioSegment]
+    ) -> AudioSegment:
+        """Return a cached chunk, decoded with loader (outside the lock) on a miss."""
+        sound: Optional[AudioSegment] = self.get(key)
+        if sound is None:
+            sound = loader()
+            self.put(key, sound)
+        return sound
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.size,
+            }
+
+    def clear(self):
+        """Drop every entry and reset the counters, e.g. between benchmark runs."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+CHUNK_CACHE: ChunkCache = ChunkCache(CHUNK_CACHE_BYTES)
+# Forks wait for the lock, so a child never inherits it held by a thread it does not
+# have, nor the entries half updated.
+os.register_at_fork(
+    before=CHUNK_CACHE._lock.acquire,
+    after_in_parent=CHUNK_CACHE._lock.release,
+    after_in_child=CHUNK_CACHE._lock.release,
+)
@@ -0,0 +1,134 @@
+"""
+Measure cut latency across chunk lengths on synthetic audio, for SOURCE_SPLIT_INTERVALS.
+
+Usage: python chunk_tuning.py --minutes 40 --intervals 5000 10000 20000 40000 --cuts 200
+"""
+
+from typing import Any, Dict, List
+from pathlib import Path
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+from pydub import AudioSegment
+
+from audio_prep import splitter
+from chunk_cache import CHUNK_CACHE
+from cutter import file_finder
+from manifest import new_manifest, save_manifest
+
+
+def synthetic_source(
+    duration: int, frame_rate: int = 44100, channels: int = 2, seed: int = 0
+) -> AudioSegment:
+    """
+    A speech-like test source of duration ms: a harmonic tone with a wandering pitch
+    plus noise, under a syllable-rate envelope with pauses between phrases.
+    """
+    rng = np.random.default_rng(seed)
+    blocks: List[bytes] = []
+    block_frames: int = 60 * frame_rate  # Generate a minute at a time.
+    total_frames: int = duration * frame_rate // 1000
+
+    for first in range(0, total_frames, block_frames):
+        t: np.ndarray = (
+            np.arange(first, min(total_frames, first + block_frames)) / frame_rate
+        )
+        pitch: np.ndarray = 150 + 50 * np.sin(2 * np.pi * 0.3 * t)
+        phase: np.ndarray = 2 * np.pi * np.cumsum(pitch) / frame_rate
+        voice: np.ndarray = sum(np.sin(k * phase) / k for k in range(1, 6))
+        syllables: np.ndarray = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+        phrases: np.ndarray = (np.sin(2 * np.pi * 0.2 * t) > -0.5).astype(np.float64)
+        signal: np.ndarray = (
+            0.3 * voice * syllables * phrases + 0.01 * rng.standard_normal(len(t))
+        )
+        samples: np.ndarray = np.repeat(signal[:, None], channels, axis=1)
+        blocks.append((np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes())
+
+    return AudioSegment(
+        data=b"".join(blocks), sample_width=2, frame_rate=frame_rate, channels=channels
+    )
+
+
+def prepare_source(sound: AudioSegment, sound_name: str, interval: int, folder: Path):
+    """Split sound into interval-long mp3 chunks in folder, with a finished manifest."""
+    splitter(sound, sound_name, interval=interval, folder=folder)
+    manifest: Dict[str, Any] = new_manifest(
+        sound_name,
+        content_hash="",
+        layout="mp3",
+        duration=len(sound),
+        chunk_count=len(range(0, len(sound), interval)),
+        split_interval=interval,
+    )
+    manifest["complete"] = True
+    save_manifest(manifest, folder)
+
+
+def cut_lengths(count: int, seed: int = 0) -> np.ndarray:
+    """Quote lengths in ms: mostly a few seconds, sometimes up to a minute."""
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.lognormal(np.log(3000), 0.8, count), 300, 60000).astype(int)
+
+
+def measure(
+    sound: AudioSegment, interval: int, cuts: int, seed: int = 0
+) -> Dict[str, Any]:
+    """Split sound into interval-long chunks and time file_finder on random cuts."""
+    sound_name: str = "synthetic.wav"
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        folder: Path = Path(temp_dir)
+        prepare_source(sound, sound_name, interval, folder)
+
+        latencies: List[float] = []
+        for length in cut_lengths(cuts, seed):
+            start: int = int(rng.integers(0, len(sound) - length))
+            # Time cold cuts; the cache would hide the chunk length.
+            CHUNK_CACHE.clear()
+            tic: float = time.perf_counter()
+            file_finder(start, start + int(length), sound_name, folder)
+            latencies.append((time.perf_counter() - tic) * 1000)
+
+    latencies_ms: np.ndarray = np.array(latencies)
+    return {
+        "interval": interval,
+        "cuts": cuts,
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p90_ms": float(np.percentile(latencies_ms, 90)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--minutes", type=int, default=40, help="Length of the source.")
+    parser.add_argument(
+        "--intervals",
+        type=int,
+        nargs="+",
+        default=[5000, 10000, 20000, 40000, 60000],
+        help="Chunk lengths to compare, in ms.",
+    )
+    parser.add_argument("--cuts", type=int, default=200, help="Cuts per chunk length.")
+    parser.add_argument(
+        "--output", type=Path, help="Also write results to this json file."
+    )
+    args = parser.parse_args()
+
+    source: AudioSegment = synthetic_source(args.minutes * 60 * 1000)
+    results: List[Dict[str, Any]] = [
+        measure(source, interval, args.cuts) for interval in args.intervals
+    ]
+
+    print(f"{'interval':>10} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9}  (ms)")
+    for result in results:
+        print(
+            "{interval:>10} {mean_ms:9.1f} {p50_ms:9.1f} {p90_ms:9.1f} "
+            "{p99_ms:9.1f}".format(**result)
+        )
+    if args.output:
+        json.dump(results, open(args.output, "w"), indent=2)
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Any, Dict, List
 from pathlib import Path
 
 VIDEOS: Dict[str, str] = {
@@ -14,6 +14,51 @@ DEFAULT_AUDIO_SOURCES: Dict[str, str] = {
 }
 
 SPLIT_INTERVAL: int = 20000  # in ms, 1000 ms == 1 sec
+# Per-source chunk lengths overriding SPLIT_INTERVAL, e.g. picked with chunk_tuning.py.
+SOURCE_SPLIT_INTERVALS: Dict[str, int] = {}
+# Upper bound on decoded chunks kept in memory by the cutter.
+CHUNK_CACHE_BYTES: int = 256 * 1024 * 1024
+# Chunks warmed on either side of a timestamp being typed, and prefetches let queue.
+PREFETCH_RADIUS: int = 1
+PREFETCH_PENDING: int = 2
+CHUNK_CODEC: Dict[str, str] = {"format": "mp3", "bitrate": "128k"}
+# Export settings of submitted clips, and of the rendition played right after a cut.
+CLIP_CODEC: Dict[str, Any] = {"format": "mp3"}
+PREVIEW_CODEC: Dict[str, Any] = {
+    "format": "mp3",
+    "bitrate": "48k",
+    "parameters": ["-ac", "1", "-ar", "22050"],
+}
 ASSET_FOLDER: Path = Path(__file__).parent.joinpath("assets")
 OUTPUT_FOLDER: Path = Path(__file__).parent.joinpath("saves")
-TEMP_PREFIX: str = "ztemp_"
+# Clip records, and the export of the first version of the app they were migrated from.
+RECORD_DB: Path = ASSET_FOLDER.joinpath("records.sqlite3")
+RECORD_PAGE_SIZE: int = 15
+LEGACY_EXPORT: Path = Path(__file__).parent.parent.joinpath("data", "export.csv")
+PROCESSED_FOLDER: Path = ASSET_FOLDER.joinpath("processed")
+# Disk cache backing the background callback manager: job queue, progress and results.
+JOB_CACHE_FOLDER: Path = ASSET_FOLDER.joinpath("jobs")
+# Long-lived processes running background cuts, per server process; each keeps its own
+# chunk cache, and all jobs of a source go to the same one.
+CUT_WORKERS: int = 2
+# Rendered cuts and previews, keyed by source manifest and cut parameters.
+RENDER_CACHE_FOLDER: Path = ASSET_FOLDER.joinpath("renders")
+RENDER_CACHE_BYTES: int = 512 * 1024 * 1024
+# Each process checks the render cache size after writing this much to it, rather than
+# on every write; the cache may overshoot RENDER_CACHE_BYTES by this much per process.
+RENDER_CACHE_CHECK_BYTES: int = 16 * 1024 * 1024
+
+# Raw PCM sample store, an alternative to the mp3 chunk layout.
+PCM_SUFFIX: str = ".pcm"
+PCM_HEADER_SUFFIX: str = ".pcm.json"
+MANIFEST_SUFFIX: str = ".manifest.json"
+
+# Whole-source mp3 plus a seek index of its frames, read by byte range.
+INDEXED_AUDIO_SUFFIX: str = ".mp3"
+FRAME_INDEX_SUFFIX: str = ".frames.npz"
+
+# Min/max/RMS waveform pyramid of each source, one level per bucket size (in frames).
+PEAKS_SUFFIX: str = ".peaks"
+PEAK_LEVELS: List[int] = [128, 512, 2048, 8192, 32768]
+# Wave plot columns of a saved clip, next to it in the saves folder.
+SAVED_PEAKS_SUFFIX: str = ".peaks.json"
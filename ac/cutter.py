@@ -1,144 +1,356 @@
 #!/usr/bin/env python3
 import datetime
-from typing import Any, Dict, Tuple
+import os
+import threading
+import uuid
+from io import BytesIO
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from pathlib import Path
 
 from pydub import AudioSegment
 
 from constants import (
-    ASSET_FOLDER,
-    SPLIT_INTERVAL,
-    OUTPUT_FOLDER,
+    PROCESSED_FOLDER,
+    RENDER_CACHE_FOLDER,
+    CLIP_CODEC,
+    PREVIEW_CODEC,
+    PREFETCH_RADIUS,
+    PREFETCH_PENDING,
 )
+from timefmt import formatter_lv0
+from manifest import chunk_interval, load_manifest
+from chunk_cache import CHUNK_CACHE
+from render_cache import render_key, load_clip, save_clip
+from pcm_store import has_pcm, pcm_slice
+from frame_index import has_index, index_slice, copy_frames
 
 
 class CutError(Exception):
     pass
 
 
-def formatter_lv1(singleTS):
-    tmpTS = []
-    try:
-        tmpTS = singleTS.split(":")
-    except:
-        raise ValueError("input error")
-    lenTmpTs = len(tmpTS)
-    totalmsec = 0
-    formatted_str = ""
-
-    if lenTmpTs == 3:
-        totalmsec += int(tmpTS[0]) * 60 * 1000 + int(tmpTS[1]) * 1000 + int(tmpTS[2])
-        formatted_str = "{:02d}:".format(int(tmpTS[0])) + "{:02d}".format(int(tmpTS[1]))
-    elif lenTmpTs == 2:
-        totalmsec += int(tmpTS[0]) * 60 * 1000 + int(tmpTS[1]) * 1000
-        formatted_str = "{:02d}:".format(int(tmpTS[0])) + "{:02d}".format(int(tmpTS[1]))
-    elif lenTmpTs == 1:
-        totalmsec += int(tmpTS[0]) * 1000
-        formatted_str = "00:" + "{:02d}".format(int(tmpTS[0]))
+def _chunk_file(
+    video_name: str, index: int, interval: int, folder: Path
+) -> Tuple[Path, Tuple[str, int]]:
+    """Path of a chunk and its chunk cache key; a reprocessed file is a new key."""
+    path: Path = folder.joinpath("{}_{}_{}.mp3".format(video_name, index, interval))
+    return path, (str(path), path.stat().st_mtime_ns)
 
-    else:
-        raise ValueError("input error")
 
-    return totalmsec, formatted_str
+def load_chunk(
+    video_name: str, index: int, interval: int, folder: Path = PROCESSED_FOLDER
+) -> AudioSegment:
+    """Decoded chunk, shared through the chunk cache."""
+    path, key = _chunk_file(video_name, index, interval, folder)
+    return CHUNK_CACHE.get_or_load(key, lambda: AudioSegment.from_file(path))
 
 
-def formatter_lv0(time_string: str):
-    if len(time_string) > 50:
-        raise ValueError("too long")
-    tmpstr = []
-    try:
-        tmpstr = time_string.split("-")
-    except:
-        raise ValueError("""must include '-' """)
-    assert len(tmpstr) == 2
+# One thread decodes prefetched chunks, so prefetching never takes more than a core.
+_PREFETCHER: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)
+_prefetch_slots = threading.BoundedSemaphore(PREFETCH_PENDING)
+_prefetch_target: Dict[str, Any] = {}
 
-    start, startstr = formatter_lv1(tmpstr[0])
-    end, endstr = formatter_lv1(tmpstr[1])
-    assert end > start
 
-    return start, end, startstr + "-" + endstr
+def _reset_prefetcher():
+    """A forked child has none of the parent's threads: give it its own prefetcher."""
+    global _PREFETCHER, _prefetch_slots
+    _PREFETCHER = ThreadPoolExecutor(max_workers=1)
+    _prefetch_slots = threading.BoundedSemaphore(PREFETCH_PENDING)
+    _prefetch_target.clear()
 
 
-def file_finder(start, end, video_name):
-    start_file = start // SPLIT_INTERVAL
-    start_point = start % SPLIT_INTERVAL
+os.register_at_fork(after_in_child=_reset_prefetcher)
 
-    end_file = end // SPLIT_INTERVAL
-    end_point = end % SPLIT_INTERVAL
 
-    sound = AudioSegment.from_file(
-        ASSET_FOLDER.joinpath(
-            "processed/{}_{}_{}.mp3".format(video_name, start_file, SPLIT_INTERVAL)
-        )
+def prefetch_chunks(
+    video_name: str, position: int, folder: Path = PROCESSED_FOLDER
+) -> bool:
+    """
+    Decode the chunks around position (in ms) into the chunk cache in the background.
+    Returns False, doing nothing, for sources without chunks. When PREFETCH_PENDING
+    prefetches are already queued, they warm the new position instead.
+    """
+    manifest: Optional[Dict[str, Any]] = load_manifest(video_name, folder)
+    if manifest is None or manifest["layout"] != "mp3" or not manifest["complete"]:
+        return False
+    # Only the latest target is worth warming: queued and running prefetches drop the
+    # older ones and pick it up.
+    _prefetch_target["latest"] = (
+        video_name,
+        position,
+        manifest["split_interval"],
+        manifest["chunk_count"],
+        folder,
     )
+    if _prefetch_slots.acquire(blocking=False):
+        future: Future = _PREFETCHER.submit(_warm_chunks)
+        future.add_done_callback(lambda _: _prefetch_slots.release())
+    return True
+
+
+def _warm_chunks():
+    """Warm the chunks around the latest target, starting over whenever it changes."""
+    target: Optional[Tuple] = None
+    while target is not _prefetch_target.get("latest"):
+        target = _prefetch_target.get("latest")
+        video_name, position, interval, chunk_count, folder = target
+        center: int = position // interval
+        first: int = max(0, center - PREFETCH_RADIUS)
+        for index in range(first, min(chunk_count, center + PREFETCH_RADIUS + 1)):
+            if _prefetch_target.get("latest") is not target:
+                break
+            path, key = _chunk_file(video_name, index, interval, folder)
+            if key not in CHUNK_CACHE:
+                CHUNK_CACHE.put(key, AudioSegment.from_file(path))
+
+
+def chunk_slice(
+    start: int,
+    end: int,
+    video_name: str,
+    folder: Path = PROCESSED_FOLDER,
+    load: Optional[Callable[[int], AudioSegment]] = None,
+) -> AudioSegment:
+    """Cut [start, end] (in ms) out of the mp3 chunks of a source; load decodes one."""
+    # Chunk length is recorded per source when it is processed.
+    interval = chunk_interval(video_name, folder)
+    if load is None:
+        load = lambda index: load_chunk(video_name, index, interval, folder)
+    start_file = start // interval
+    start_point = start % interval
+
+    end_file = end // interval
+    end_point = end % interval
+
+    sound = load(start_file)
 
     if start_file == end_file:
         return sound[start_point : end_point + 1]
     elif start_file < end_file:
-        sound = sound[start_point:]
-        left = start_file + 1
-        while left <= end_file:
-            temp = AudioSegment.from_file(
-                ASSET_FOLDER.joinpath(
-                    "processed/{}_{}_{}.mp3".format(video_name, left, SPLIT_INTERVAL)
-                )
+        # Copy every piece once into an output sized from all of them, rather than
+        # growing the cut one chunk at a time.
+        pieces: List[Union[memoryview, bytes]] = [
+            _piece(sound, start_point, len(sound))
+        ]
+        for index in range(start_file + 1, end_file + 1):
+            temp = load(index)
+            pieces.append(
+                _piece(temp, 0, end_point if index == end_file else len(temp))
             )
-            if left == end_file:
-                temp = temp[:end_point]
-            sound += temp
-            left += 1
-        return sound
+        return AudioSegment(
+            data=b"".join(pieces),
+            sample_width=sound.sample_width,
+            frame_rate=sound.frame_rate,
+            channels=sound.channels,
+        )
     else:
         exit(1)
 
 
-def cut_audio(
-    video_name: str, time_str: str, quote: str, title: str, mono: bool, edits: int
-) -> Tuple[AudioSegment, Dict[str, Any]]:
+def _piece(sound: AudioSegment, start: int, end: int) -> Union[memoryview, bytes]:
+    """Samples of sound[start:end] (in ms), uncopied, rounded and padded like pydub."""
+    first: int = int(min(start, len(sound)) * sound.frame_rate / 1000.0)
+    last: int = int(min(end, len(sound)) * sound.frame_rate / 1000.0)
+    data = memoryview(sound.raw_data)[
+        first * sound.frame_width : last * sound.frame_width
+    ]
+    missing: int = (last - first) * sound.frame_width - len(data)
+    return data if not missing else bytes(data) + bytes(missing)
+
+
+def source_layout(video_name: str, folder: Path = PROCESSED_FOLDER) -> str:
     """
-    Given a time range (in time_str), use the correct source (in video_name) to cut the requested
-    small piece of audio. Updates the meta table as well.
+    Layout a source was last processed into, as its manifest records, whatever files of
+    earlier layouts are left next to it. Sources processed before manifests existed are
+    recognized by their files.
     """
-    if not time_str:
-        return True
-    edits = max(0, int(edits))
-    start, end, _ = formatter_lv0(time_str.replace(" ", ""))
+    manifest: Optional[Dict[str, Any]] = load_manifest(video_name, folder)
+    if manifest is not None:
+        return manifest["layout"]
+    if has_pcm(video_name, folder):
+        return "pcm"
+    if has_index(video_name, folder):
+        return "indexed"
+    return "mp3"
 
-    # Find related files and get the cut piece.
-    interested = file_finder(start, end, str(video_name) + "_audio.m4a")
-    try:
-        interested.export(
-            OUTPUT_FOLDER.parent.joinpath("assets/temp/temp.mp3"),
-            format="mp3",
-        )
-    except:
-        raise CutError
 
-    # Adding entry to table
+def file_finder(start, end, video_name, folder: Path = PROCESSED_FOLDER):
+    layout: str = source_layout(video_name, folder)
+    # Sources preprocessed into the raw sample store are sliced without decoding.
+    if layout == "pcm":
+        return pcm_slice(start, end, video_name, folder)
+    # Indexed sources only decode the frames covering the cut.
+    if layout == "indexed":
+        return index_slice(start, end, video_name, folder)
+    return chunk_slice(start, end, video_name, folder)
+
+
+def cut_record(
+    video_name: str, time_str: str, quote: str, title: str, edits: int
+) -> Dict[str, Any]:
+    """The meta table entry of a cut."""
+    start, end, _ = formatter_lv0(time_str.replace(" ", ""))
     currentDT = datetime.datetime.now()
     generate_time = currentDT.strftime("%m/%d/%Y %H:%M:%S")
     audio_length = "{:10.2f}".format((end - start) / 1000) + "s"
 
-    new_row: Dict[str, Any] = {
+    return {
         "Title": title,
         "Quotes": quote,
         "Time": time_str,
         "Length": audio_length,
         "Submission": generate_time,
         "Source": video_name,
-        "Edits": edits,
+        "Edits": max(0, int(edits)),
     }
 
+
+def render_clip(
+    video_name: str,
+    time_str: str,
+    mono: bool,
+    preview: bool = False,
+    folder: Path = PROCESSED_FOLDER,
+    cache_folder: Path = RENDER_CACHE_FOLDER,
+) -> Tuple[Optional[AudioSegment], bytes, str]:
+    """
+    Cut time_str out of the source of video_name and encode it in memory, with
+    PREVIEW_CODEC when preview is set and CLIP_CODEC otherwise. Returns the decoded cut,
+    the encoded clip and the clip id it is kept under in the render cache. Cuts already
+    in the render cache, and cuts from indexed sources that need no processing (written
+    by copying mp3 frames, whatever the rendition), return no decoded audio.
+    """
+    start, end, _ = formatter_lv0(time_str.replace(" ", ""))
+    sound_name: str = str(video_name) + "_audio.m4a"
+    codec: Dict[str, Any] = PREVIEW_CODEC if preview else CLIP_CODEC
+
+    # Fast paths: no decode nor encode.
+    key: Optional[str] = render_key(sound_name, start, end, mono, codec, folder)
+    clip: Optional[bytes] = None if key is None else load_clip(key, cache_folder)
+    cached: bool = clip is not None
+    if clip is None and not mono and source_layout(sound_name, folder) == "indexed":
+        clip = copy_frames(start, end, sound_name, folder)
+
+    interested: Optional[AudioSegment] = None
+    if clip is None:
+        # Find related files and get the cut piece.
+        interested = file_finder(start, end, sound_name, folder)
+        if mono:
+            interested = interested.set_channels(1)
+        buffer = BytesIO()
+        try:
+            interested.export(buffer, **codec)
+        except:
+            raise CutError
+        clip = buffer.getvalue()
+
+    # Sources without a manifest still get an id to be served by; the cache evicts it.
+    clip_id: str = key if key is not None else uuid.uuid4().hex
+    if not cached:
+        save_clip(clip_id, clip, cache_folder)
+    return interested, clip, clip_id
+
+
+def cut_audio(
+    video_name: str,
+    time_str: str,
+    quote: str,
+    title: str,
+    mono: bool,
+    edits: int,
+    output_path: Path,
+    preview: bool = False,
+    folder: Path = PROCESSED_FOLDER,
+    cache_folder: Path = RENDER_CACHE_FOLDER,
+) -> Tuple[Optional[AudioSegment], Dict[str, Any]]:
+    """
+    Given a time range (in time_str), use the correct source (in video_name) to cut the
+    requested small piece of audio, written to output_path in the preview rendition if
+    preview is set. Updates the meta table as well.
+    """
+    if not time_str:
+        return True
+    interested, clip, _ = render_clip(
+        video_name, time_str, mono, preview, folder, cache_folder
+    )
+    output_path.write_bytes(clip)
+
+    # Adding entry to table
+    new_row: Dict[str, Any] = cut_record(video_name, time_str, quote, title, edits)
+
     return interested, new_row
 
 
-audioPath = "data/sample.aac"
-testInterval = "0:30-1:3"
+def _merged_spans(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Union of overlapping [start, end] ranges, in order."""
+    spans: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if spans and start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((start, end))
+    return spans
 
-cut_audio(
-    video_name="2012",
-    time_str="25:54:490-25:57:000",
-    quote="oaic",
-    title="oaic",
-    mono=False,
-    edits=0,
-)
+
+def cut_batch(
+    requests: List[Tuple[str, str, Dict[str, Any]]], folder: Path = PROCESSED_FOLDER
+) -> List[Tuple[AudioSegment, Dict[str, Any]]]:
+    """
+    Cut many (video_name, time_str, metadata) requests, metadata holding the quote,
+    title, mono and edits arguments of cut_audio. Requests are grouped by source so each
+    chunk, or each overlapping span of a pcm or indexed source, is decoded once. Returns
+    the clips and their meta table entries in input order; nothing is exported.
+    """
+    results: List[Optional[Tuple[AudioSegment, Dict[str, Any]]]]
+    results = [None] * len(requests)
+    by_source: Dict[str, List[Tuple[int, int, int]]] = {}
+    for i, (video_name, time_str, _) in enumerate(requests):
+        start, end, _ = formatter_lv0(time_str.replace(" ", ""))
+        by_source.setdefault(str(video_name) + "_audio.m4a", []).append((i, start, end))
+
+    for sound_name, cuts in by_source.items():
+        clips: Dict[int, AudioSegment] = {}
+        if source_layout(sound_name, folder) in ["pcm", "indexed"]:
+            spans: List[Tuple[int, int]] = _merged_spans([(s, e) for _, s, e in cuts])
+            for span_start, span_end in spans:
+                sound: AudioSegment = file_finder(
+                    span_start, span_end, sound_name, folder
+                )
+                for i, start, end in cuts:
+                    if span_start <= start and end <= span_end:
+                        clips[i] = sound[start - span_start : end - span_start + 1]
+        else:
+            # Chunks are held while cuts may still need them, whatever the shared cache
+            # evicts; cuts go in source order, so the chunks before the current one are
+            # done with.
+            interval: int = chunk_interval(sound_name, folder)
+            decoded: Dict[int, AudioSegment] = {}
+
+            def load(index: int) -> AudioSegment:
+                if index not in decoded:
+                    decoded[index] = load_chunk(sound_name, index, interval, folder)
+                return decoded[index]
+
+            for i, start, end in sorted(cuts, key=lambda cut: cut[1]):
+                for index in [index for index in decoded if index < start // interval]:
+                    del decoded[index]
+                clips[i] = chunk_slice(start, end, sound_name, folder, load)
+
+        for i, _, _ in cuts:
+            video_name, time_str, meta = requests[i]
+            clip: AudioSegment = clips[i]
+            if meta.get("mono"):
+                clip = clip.set_channels(1)
+            results[i] = (
+                clip,
+                cut_record(
+                    video_name,
+                    time_str,
+                    meta.get("quote", ""),
+                    meta.get("title", ""),
+                    meta.get("edits", 0),
+                ),
+            )
+
+    return results
@@ -0,0 +1,378 @@
+"""
+Seek index over the frames of a whole-source mp3, so a cut only reads and decodes the
+frames covering it instead of fixed SPLIT_INTERVAL chunks.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+from subprocess import Popen, PIPE
+import io
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.utils import mediainfo
+
+from constants import (
+    ASSET_FOLDER,
+    PROCESSED_FOLDER,
+    CHUNK_CODEC,
+    INDEXED_AUDIO_SUFFIX,
+    FRAME_INDEX_SUFFIX,
+)
+from peaks import PeakBuilder
+from atomic_files import atomic_path
+
+
+# Layer III only. Indexed by [is MPEG1][bitrate index], in kbps.
+BITRATES: Dict[bool, List[int]] = {
+    True: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    False: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Indexed by version bits: MPEG2.5, reserved, MPEG2, MPEG1.
+SAMPLE_RATES: Dict[int, List[int]] = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+# Decoder delay of the mp3 synthesis filterbank, on top of the LAME tag encoder delay.
+DECODER_DELAY: int = 529
+# Encoder delay and end padding are 12-bit fields of the LAME tag.
+MAX_PADDING: int = 4095
+
+
+class FrameHeader:
+    def __init__(self, header: bytes):
+        version: int = (header[1] >> 3) & 3
+        self.mpeg1: bool = version == 3
+        self.frame_rate: int = SAMPLE_RATES[version][(header[2] >> 2) & 3]
+        self.bitrate: int = BITRATES[self.mpeg1][header[2] >> 4]
+        self.mono: bool = (header[3] >> 6) == 3
+        self.samples_per_frame: int = 1152 if self.mpeg1 else 576
+        self.frame_length: int = (144 if self.mpeg1 else 72) * self.bitrate * 1000 // (
+            self.frame_rate
+        ) + ((header[2] >> 1) & 1)
+        # Xing/Info tags sit right after the side information.
+        if self.mpeg1:
+            self.side_info_end: int = 4 + (17 if self.mono else 32)
+        else:
+            self.side_info_end = 4 + (9 if self.mono else 17)
+        # Largest look-back of the bit reservoir, in bytes.
+        self.reservoir: int = 511 if self.mpeg1 else 255
+
+    @staticmethod
+    def is_valid(header: bytes) -> bool:
+        return (
+            len(header) == 4
+            and header[0] == 0xFF
+            and (header[1] & 0xE0) == 0xE0
+            and ((header[1] >> 3) & 3) != 1  # Version.
+            and ((header[1] >> 1) & 3) == 1  # Layer III.
+            and 0 < (header[2] >> 4) < 15  # Bitrate, free format is not supported.
+            and ((header[2] >> 2) & 3) != 3  # Sample rate.
+        )
+
+
+def audio_path(sound_name: str, folder: Path = PROCESSED_FOLDER) -> Path:
+    return folder.joinpath(sound_name + INDEXED_AUDIO_SUFFIX)
+
+
+def index_path(sound_name: str, folder: Path = PROCESSED_FOLDER) -> Path:
+    return folder.joinpath(sound_name + FRAME_INDEX_SUFFIX)
+
+
+def has_index(sound_name: str, folder: Path = PROCESSED_FOLDER) -> bool:
+    return (
+        audio_path(sound_name, folder).is_file()
+        and index_path(sound_name, folder).is_file()
+    )
+
+
+def encode_source(
+    sound_name: str,
+    folder: Path = PROCESSED_FOLDER,
+    peaks: Optional[PeakBuilder] = None,
+):
+    """
+    Encode a whole source into one mp3. ffmpeg streams it, so memory stays flat. With
+    peaks, the same decode also pipes raw samples into the waveform pyramid. The mp3 is
+    written aside and renamed into place, so an interrupted run leaves the previous one
+    whole.
+    """
+    with atomic_path(audio_path(sound_name, folder)) as temp_path:
+        _encode(sound_name, temp_path, peaks)
+
+
+def _encode(sound_name: str, output: Path, peaks: Optional[PeakBuilder]):
+    samples_output: List[str] = []
+    if peaks is not None:
+        samples_output = ["-vn", "-f", "s16le", "-acodec", "pcm_s16le", "-"]
+    process = Popen(
+        [
+            AudioSegment.converter,
+            "-y",
+            "-v",
+            "error",
+            "-i",
+            str(ASSET_FOLDER.joinpath(sound_name)),
+            "-vn",
+            "-acodec",
+            "libmp3lame",
+            "-b:a",
+            CHUNK_CODEC["bitrate"],
+            "-f",
+            "mp3",
+            str(output),
+            *samples_output,
+        ],
+        stdout=PIPE if peaks is not None else None,
+        stderr=PIPE,
+    )
+    if peaks is not None:
+        info: Dict[str, Any] = mediainfo(str(ASSET_FOLDER.joinpath(sound_name)))
+        frame_rate: int = int(info["sample_rate"])
+        channels: int = int(info["channels"])
+        while True:
+            data: bytes = process.stdout.read(frame_rate * channels * 2)  # A second.
+            if len(data) < channels * 2:
+                break
+            peaks.add(
+                AudioSegment(
+                    data=data[: len(data) // (channels * 2) * channels * 2],
+                    sample_width=2,
+                    frame_rate=frame_rate,
+                    channels=channels,
+                )
+            )
+    _, error = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"Encoding {sound_name} failed: {error.decode()}")
+
+
+def _skip_id3(data: bytes) -> int:
+    if data[:3] != b"ID3":
+        return 0
+    size: int = 0
+    for byte in data[6:10]:  # Syncsafe integer.
+        size = (size << 7) | (byte & 0x7F)
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+def _info_tag_skip(data: bytes, offset: int, header: FrameHeader) -> Optional[int]:
+    """
+    If the frame at offset is a Xing/Info tag instead of audio, return how many decoded
+    samples players drop at the start (encoder plus decoder delay), else None.
+    """
+    position: int = offset + header.side_info_end
+    if data[position : position + 4] not in (b"Xing", b"Info"):
+        return None
+    flags: int = int.from_bytes(data[position + 4 : position + 8], "big")
+    position += 8
+    position += 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4)
+    position += 4 * bool(flags & 8)
+    # Encoder delay sits 21 bytes into the LAME extension, next to the end padding.
+    if data[position : position + 4] not in (b"LAME", b"Lavf", b"Lavc"):
+        return 0
+    delay: int = int.from_bytes(data[position + 21 : position + 24], "big") >> 12
+    return delay + DECODER_DELAY
+
+
+def build_index(sound_name: str, folder: Path = PROCESSED_FOLDER) -> Dict[str, Any]:
+    """
+    Scan an mp3 and save the byte offset and timestamp (in decoded samples) of every
+    audio frame, along with what is needed to decode from the middle of the stream.
+    """
+    data: bytes = audio_path(sound_name, folder).read_bytes()
+    offset: int = _skip_id3(data)
+    while offset + 4 <= len(data) and not FrameHeader.is_valid(
+        data[offset : offset + 4]
+    ):
+        offset += 1
+
+    first: FrameHeader = FrameHeader(data[offset : offset + 4])
+    skip: Optional[int] = _info_tag_skip(data, offset, first)
+    if skip is not None:
+        offset += first.frame_length
+    else:
+        skip = 0
+
+    offsets: List[int] = []
+    smallest_frame: int = first.frame_length
+    while offset + 4 <= len(data) and FrameHeader.is_valid(data[offset : offset + 4]):
+        header: FrameHeader = FrameHeader(data[offset : offset + 4])
+        offsets.append(offset)
+        smallest_frame = min(smallest_frame, header.frame_length)
+        offset += header.frame_length
+    offsets.append(min(offset, len(data)))  # End of the last frame.
+
+    index: Dict[str, Any] = {
+        "offsets": np.array(offsets, dtype=np.int64),
+        # Decoded sample at which each frame starts; players drop negative ones.
+        "timestamps": np.arange(len(offsets) - 1, dtype=np.int64)
+        * first.samples_per_frame
+        - skip,
+        "frame_rate": first.frame_rate,
+        "channels": 1 if first.mono else 2,
+        "samples_per_frame": first.samples_per_frame,
+        "skip": skip,
+        # Frames to decode ahead of a cut: enough to cover the bit reservoir, plus one
+        # for the overlap of the synthesis filterbank.
+        "priming_frames": -(-first.reservoir // smallest_frame) + 1,
+    }
+    # A file object, since np.savez would add .npz to the name of the temp file.
+    with atomic_path(index_path(sound_name, folder)) as temp_path:
+        with open(temp_path, "wb") as f:
+            np.savez(f, **index)
+    return index
+
+
+def load_index(sound_name: str, folder: Path = PROCESSED_FOLDER) -> Dict[str, Any]:
+    with np.load(index_path(sound_name, folder)) as index:
+        return {key: index[key] for key in index.files}
+
+
+def frame_range(
+    index: Dict[str, Any], first_sample: int, last_sample: int
+) -> Tuple[int, int]:
+    """First and last frame to decode for the samples [first_sample, last_sample)."""
+    timestamps: np.ndarray = index["timestamps"]
+    first_frame: int = max(
+        0,
+        int(np.searchsorted(timestamps, first_sample, side="right"))
+        - 1
+        - int(index["priming_frames"]),
+    )
+    last_frame: int = max(
+        first_frame,
+        int(np.searchsorted(timestamps, last_sample, side="left")) - 1,
+    )
+    return first_frame, min(last_frame, len(timestamps) - 1)
+
+
+def index_slice(
+    start: int, end: int, sound_name: str, folder: Path = PROCESSED_FOLDER
+) -> AudioSegment:
+    """Return [start, end] (in ms, end inclusive like file_finder) from its frames."""
+    index: Dict[str, Any] = load_index(sound_name, folder)
+    frame_rate: int = int(index["frame_rate"])
+    first_sample: int = start * frame_rate // 1000
+    last_sample: int = (end + 1) * frame_rate // 1000
+
+    first_frame, last_frame = frame_range(index, first_sample, last_sample)
+    offsets: np.ndarray = index["offsets"]
+    with open(audio_path(sound_name, folder), "rb") as f:
+        f.seek(int(offsets[first_frame]))
+        data: bytes = f.read(int(offsets[last_frame + 1] - offsets[first_frame]))
+
+    # Without an Info tag the decoder keeps every sample, so the output starts exactly
+    # at the first frame read.
+    sound: AudioSegment = AudioSegment.from_file(
+        io.BytesIO(data), format="mp3", codec="mp3"
+    )
+    lead: int = first_sample - int(index["timestamps"][first_frame])
+    return sound.get_sample_slice(lead, lead + last_sample - first_sample)
+
+
+def _crc16(data: bytes) -> int:
+    """CRC-16 (polynomial 0x8005, reflected) protecting the LAME tag."""
+    crc: int = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def _info_frame(
+    template: bytes, frames: int, size: int, delay: int, padding: int
+) -> bytes:
+    """
+    An Info (CBR Xing) frame with a LAME tag telling players how many samples to drop
+    at both ends, formatted like the first audio frame of the clip (template, its 4
+    header bytes).
+    """
+    header: bytearray = bytearray(template)
+    header[1] |= 1  # No CRC after the header.
+    header[2] &= 0xFD  # No padding slot.
+    # The tag needs about 200 bytes; pick the lowest bitrate giving a frame that large.
+    for bitrate_index in range(1, 15):
+        header[2] = (header[2] & 0x0F) | (bitrate_index << 4)
+        if FrameHeader(bytes(header)).frame_length >= 200:
+            break
+    info: FrameHeader = FrameHeader(bytes(header))
+    frame: bytearray = bytearray(info.frame_length)
+    frame[:4] = header
+
+    position: int = info.side_info_end
+    total_size: int = size + info.frame_length
+    tag: bytearray = bytearray(b"Info")
+    tag += (0x0F).to_bytes(4, "big")  # Frames, bytes, TOC and quality fields present.
+    tag += frames.to_bytes(4, "big")
+    tag += total_size.to_bytes(4, "big")
+    tag += bytes(i * 256 // 100 for i in range(100))  # Linear TOC of a CBR stream.
+    tag += (0).to_bytes(4, "big")
+    tag += b"LAME3.100"
+    tag += bytes([0x01])  # Tag revision 0, CBR.
+    # Lowpass, replay gain, flags and bitrate: unset.
+    tag += bytes(1 + 4 + 2 + 2 + 1 + 1)
+    tag += ((delay << 12) | padding).to_bytes(3, "big")
+    tag += bytes(1 + 1 + 2)  # Misc, mp3 gain, preset.
+    tag += total_size.to_bytes(4, "big")
+    tag += bytes(2)  # Music CRC, not checked by players.
+    frame[position : position + len(tag)] = tag
+    crc_position: int = position + len(tag)
+    frame[crc_position : crc_position + 2] = _crc16(frame[:crc_position]).to_bytes(
+        2, "big"
+    )
+    return bytes(frame)
+
+
+def copy_frames(
+    start: int, end: int, sound_name: str, folder: Path = PROCESSED_FOLDER
+) -> Optional[bytes]:
+    """
+    Build an mp3 of [start, end] (in ms, end inclusive like file_finder) by copying the
+    compressed frames covering it, without decoding or re-encoding. The extra samples of
+    the first and last frames are trimmed by players through the encoder delay and
+    padding of an Info frame. Returns None when the range can not be described that way,
+    e.g. for sources without an Info tag of their own, near their very start.
+    """
+    index: Dict[str, Any] = load_index(sound_name, folder)
+    frame_rate: int = int(index["frame_rate"])
+    samples_per_frame: int = int(index["samples_per_frame"])
+    timestamps: np.ndarray = index["timestamps"]
+    first_sample: int = start * frame_rate // 1000
+    last_sample: int = min(
+        (end + 1) * frame_rate // 1000,
+        int(timestamps[-1]) + samples_per_frame,
+    )
+
+    first_frame, last_frame = frame_range(index, first_sample, last_sample)
+    # Samples players must drop in front: the priming frames and the start of the first
+    # needed one. They drop the encoder delay of the tag plus DECODER_DELAY.
+    lead: int = first_sample - int(timestamps[first_frame])
+    while lead - DECODER_DELAY > MAX_PADDING and first_frame < last_frame:
+        first_frame += 1
+        lead -= samples_per_frame
+    frames: int = last_frame - first_frame + 1
+    padding: int = frames * samples_per_frame - lead - (last_sample - first_sample)
+    if not (
+        DECODER_DELAY <= lead <= MAX_PADDING + DECODER_DELAY
+        and 0 <= padding <= MAX_PADDING - DECODER_DELAY
+    ):
+        return None
+
+    offsets: np.ndarray = index["offsets"]
+    with open(audio_path(sound_name, folder), "rb") as f:
+        f.seek(int(offsets[first_frame]))
+        data: bytes = f.read(int(offsets[last_frame + 1] - offsets[first_frame]))
+
+    return (
+        _info_frame(
+            data[:4],
+            frames=frames,
+            size=len(data),
+            delay=lead - DECODER_DELAY,
+            padding=padding + DECODER_DELAY,
+        )
+        + data
+    )
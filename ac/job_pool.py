@@ -0,0 +1,126 @@
+"""Long-lived worker processes for background callbacks, each with its chunk cache."""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+import uuid
+import zlib
+
+from dash import DiskcacheManager
+
+from constants import CUT_WORKERS
+
+# Job states are dropped after this long (in s), should a worker die before clearing.
+JOB_STATE_EXPIRE: int = 3600
+RUNNING_STATES: Tuple[str, ...] = ("queued", "running")
+
+
+class WorkerPool:
+    """
+    A fixed number of single-process executors, each started on first use by forking the
+    server, so workers know every registered callback. Work goes to the worker of its
+    affinity key (e.g. the source it cuts from), so the jobs and prefetches of a source
+    meet the chunks decoded by the earlier ones.
+    """
+
+    def __init__(self, workers: int):
+        self.workers: int = workers
+        self._executors: List[Optional[ProcessPoolExecutor]] = [None] * workers
+        self._lock = threading.Lock()
+
+    def submit(self, affinity: Any, fn: Callable, *args) -> Future:
+        slot: int = zlib.crc32(str(affinity).encode()) % self.workers
+        with self._lock:
+            while True:
+                if self._executors[slot] is None:
+                    self._executors[slot] = ProcessPoolExecutor(
+                        max_workers=1, mp_context=multiprocessing.get_context("fork")
+                    )
+                try:
+                    return self._executors[slot].submit(fn, *args)
+                except BrokenProcessPool:
+                    # The worker died, e.g. was killed: start another.
+                    self._executors[slot] = None
+
+
+CUT_POOL: WorkerPool = WorkerPool(CUT_WORKERS)
+
+# The manager whose registered callbacks workers run, inherited when they are forked.
+_manager: Optional["PooledDiskcacheManager"] = None
+
+
+def _state_key(job: str) -> str:
+    return f"job-state-{job}"
+
+
+class PooledDiskcacheManager(DiskcacheManager):
+    """
+    DiskcacheManager running jobs on a WorkerPool, rather than in a new process per job,
+    so the number of job processes is bounded and their chunk caches outlive each job.
+    Job states live in the cache, so any server process can answer for any job. A
+    cancelled job that already started runs to its end and its result is dropped:
+    killing it would take its worker, and the worker's chunk cache, down with it.
+    """
+
+    def __init__(
+        self,
+        cache,
+        pool: WorkerPool = CUT_POOL,
+        affinity: Callable[[Dict[str, Any]], Any] = lambda values: None,
+        expire: Optional[int] = None,
+    ):
+        """affinity maps the input and state values ("id.property": value) to a key."""
+        global _manager
+        super().__init__(cache, expire=expire)
+        self.pool: WorkerPool = pool
+        self.affinity: Callable[[Dict[str, Any]], Any] = affinity
+        _manager = self
+
+    def call_job_fn(self, key, job_fn, args, context) -> str:
+        job_key: str = next(k for k, fn in self.func_registry.items() if fn is job_fn)
+        job: str = uuid.uuid4().hex
+        self.handle.set(_state_key(job), "queued", expire=JOB_STATE_EXPIRE)
+        values: Dict[str, Any] = {**context.input_values, **context.state_values}
+        self.pool.submit(
+            self.affinity(values),
+            _run_job,
+            job,
+            job_key,
+            key,
+            self._make_progress_key(key),
+            args,
+            dict(context),
+        )
+        return job
+
+    def job_running(self, job) -> bool:
+        return job is not None and self.handle.get(_state_key(job)) in RUNNING_STATES
+
+    def terminate_job(self, job):
+        if job is None:
+            return
+        with self.handle.transact():
+            if self.job_running(job):
+                self.handle.set(_state_key(job), "cancelled", expire=JOB_STATE_EXPIRE)
+
+    def terminate_unhealthy_job(self, job) -> bool:
+        return False
+
+
+def _run_job(job: str, job_key: str, result_key: str, progress_key: str, args, context):
+    """Worker side of PooledDiskcacheManager.call_job_fn."""
+    handle = _manager.handle
+    with handle.transact():
+        if handle.get(_state_key(job)) != "queued":  # Cancelled while queued.
+            return
+        handle.set(_state_key(job), "running", expire=JOB_STATE_EXPIRE)
+    try:
+        _manager.func_registry[job_key](result_key, progress_key, args, context)
+    finally:
+        with handle.transact():
+            if handle.get(_state_key(job)) == "cancelled":
+                handle.delete(result_key)
+                handle.delete(progress_key)
+            handle.delete(_state_key(job))
@@ -4,6 +4,8 @@ from dash import Dash, html, dcc, dash_table
 import dash_bootstrap_components as dbc
 import dash_player
 
+from constants import RECORD_PAGE_SIZE
+from record_store import DEFAULT_COLS
 from utils import get_empty_figure
 from runtime_manager import Control
 
@@ -35,6 +37,12 @@ def add_layout(app: Dash, control: Control):
         [
             # Add storage.
             dcc.Store(id="audio_file_path"),
+            # Record and audio url of the cut waiting to be submitted, per session.
+            dcc.Store(id="pending_cut", storage_type="session"),
+            # Dummy output of the prefetch callback.
+            dcc.Store(id="prefetch_status"),
+            # Index of the last submitted record, to refresh the record table.
+            dcc.Store(id="last_submitted"),
             # Add main layout.
             add_navbar(),
             dbc.Row(
@@ -69,13 +77,8 @@ def add_left_part(width: int, control: Control):
                     html.Hr(),
                     add_video_player(width=width),
                     html.Hr(),
-                    html.Div(
-                        dash_table.DataTable(
-                            control.df.to_dict("records"),
-                            [{"name": i, "id": i} for i in control.df.columns],
-                        ),
-                        id="record_table",
-                    ),
+                    add_search(),
+                    html.Div(add_record_table(), id="record_table"),
                 ]
             ),
         ],
@@ -85,11 +88,53 @@ def add_left_part(width: int, control: Control):
     )
 
 
+def add_search():
+    return html.Div(
+        [
+            dbc.Input(
+                id="search_input",
+                type="search",
+                placeholder="Search quotes and titles...",
+                debounce=True,
+                value="",
+            ),
+            # Clicking a result fills in "Load by index".
+            dash_table.DataTable(
+                id="search_results",
+                columns=[
+                    {"name": i, "id": i} for i in ["Index", "Title", "Quotes", "Source"]
+                ],
+                data=[],
+                style_cell={"textAlign": "left", "whiteSpace": "normal"},
+            ),
+            html.Hr(),
+        ]
+    )
+
+
+def add_record_table():
+    """Records are paged, sorted and filtered by the record store, a page at a time."""
+    return dash_table.DataTable(
+        id="record_table_data",
+        columns=[{"name": i, "id": i} for i in DEFAULT_COLS],
+        data=[],
+        page_current=0,
+        page_size=RECORD_PAGE_SIZE,
+        page_action="custom",
+        sort_action="custom",
+        sort_mode="multi",
+        sort_by=[],
+        filter_action="custom",
+        filter_query="",
+    )
+
+
 def add_right_part(width: int):
     return dbc.Col(
         [
             dbc.Row(
                 [
+                    add_overview_pane(),
                     add_time_inputs(),
                     add_loader(),
                     add_dual_buttons(),
@@ -103,6 +148,21 @@ def add_right_part(width: int):
     )
 
 
+def add_overview_pane():
+    return html.Div(
+        [
+            dcc.Markdown(
+                "Whole lecture (scroll to zoom, drag to pan, double click to reset)"
+            ),
+            dcc.Graph(
+                id="overview_plot",
+                figure=get_empty_figure(height=150, width=600),
+                config={"displayModeBar": False, "scrollZoom": True},
+            ),
+        ]
+    )
+
+
 def add_dual_buttons():
     return html.Div(
         [
@@ -282,6 +342,12 @@ def add_time_inputs():
             ),
             html.Label(""),  # Spacer.
             dbc.Button("Cut", id="cut_button"),
+            dbc.Progress(
+                id="cut_progress",
+                value=0,
+                max=1,
+                style={"height": "4px", "width": "85%"},
+            ),
             dcc.Markdown("before chicken", id="preview_string"),
         ],
         style={"margin": "0px 0px 0px 0px"},  # top right bottom left
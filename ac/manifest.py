@@ -0,0 +1,98 @@
+"""Per-source manifests of what preprocessing produced, so reruns can skip or resume."""
+
+from typing import Any, Dict, Iterator, Optional
+from pathlib import Path
+import hashlib
+import json
+
+from constants import (
+    PROCESSED_FOLDER,
+    SPLIT_INTERVAL,
+    SOURCE_SPLIT_INTERVALS,
+    CHUNK_CODEC,
+    MANIFEST_SUFFIX,
+)
+from atomic_files import write_atomic
+
+
+def manifest_path(sound_name: str, folder: Path = PROCESSED_FOLDER) -> Path:
+    return folder.joinpath(sound_name + MANIFEST_SUFFIX)
+
+
+def split_interval_for(sound_name: str) -> int:
+    """Chunk length (in ms) a source should be processed with."""
+    return SOURCE_SPLIT_INTERVALS.get(sound_name, SPLIT_INTERVAL)
+
+
+def source_hash(path: Path, block_size: int = 1 << 20) -> str:
+    """Content hash of an input file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def new_manifest(
+    sound_name: str,
+    content_hash: str,
+    layout: str,
+    duration: int,
+    chunk_count: int,
+    split_interval: int,
+) -> Dict[str, Any]:
+    return {
+        "source": sound_name,
+        "content_hash": content_hash,
+        "layout": layout,  # "mp3" chunks, "pcm" sample store or "indexed" whole mp3.
+        "duration": duration,  # in ms
+        "chunk_count": chunk_count,
+        "split_interval": split_interval,
+        "codec": dict(CHUNK_CODEC),
+        "complete": False,
+    }
+
+
+def load_manifest(
+    sound_name: str, folder: Path = PROCESSED_FOLDER
+) -> Optional[Dict[str, Any]]:
+    path: Path = manifest_path(sound_name, folder)
+    if not path.is_file():
+        return None
+    return json.load(open(path))
+
+
+def save_manifest(manifest: Dict[str, Any], folder: Path = PROCESSED_FOLDER):
+    """Write through a temp file so an interrupted run never leaves half a manifest."""
+    write_atomic(
+        manifest_path(manifest["source"], folder), json.dumps(manifest, indent=2)
+    )
+
+
+def is_current(
+    manifest: Optional[Dict[str, Any]], content_hash: str, layout: str
+) -> bool:
+    """Whether a manifest was produced from the same input with the same settings."""
+    return (
+        manifest is not None
+        and manifest["content_hash"] == content_hash
+        and manifest["layout"] == layout
+        and manifest["split_interval"] == split_interval_for(manifest["source"])
+        and manifest["codec"] == CHUNK_CODEC
+    )
+
+
+def chunk_interval(sound_name: str, folder: Path = PROCESSED_FOLDER) -> int:
+    """Chunk length (in ms) the processed files of a source were cut with."""
+    manifest: Optional[Dict[str, Any]] = load_manifest(sound_name, folder)
+    if manifest is None:
+        return SPLIT_INTERVAL
+    return manifest["split_interval"]
+
+
+def processed_sources(folder: Path = PROCESSED_FOLDER) -> Iterator[str]:
+    """Names of sources whose preprocessing finished, read as they are asked for."""
+    for path in folder.glob("*" + MANIFEST_SUFFIX):
+        manifest: Dict[str, Any] = json.load(open(path))
+        if manifest["complete"]:
+            yield manifest["source"]
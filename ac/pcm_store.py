@@ -0,0 +1,91 @@
+"""Flat PCM sample store: decode a source once, then slice it with numpy.memmap."""
+
+from typing import Any, Dict, Iterable, Tuple
+from pathlib import Path
+import json
+
+import numpy as np
+from pydub import AudioSegment
+
+from constants import PROCESSED_FOLDER, PCM_SUFFIX, PCM_HEADER_SUFFIX
+from atomic_files import atomic_path, write_atomic
+
+
+# Opened maps are kept per process, by path and mtime so a rewritten store is mapped
+# anew; the page cache behind them is shared by all workers.
+_MAPS: Dict[Path, Tuple[int, np.memmap]] = {}
+
+
+def pcm_path(sound_name: str, folder: Path = PROCESSED_FOLDER) -> Path:
+    return folder.joinpath(sound_name + PCM_SUFFIX)
+
+
+def header_path(sound_name: str, folder: Path = PROCESSED_FOLDER) -> Path:
+    return folder.joinpath(sound_name + PCM_HEADER_SUFFIX)
+
+
+def has_pcm(sound_name: str, folder: Path = PROCESSED_FOLDER) -> bool:
+    return (
+        pcm_path(sound_name, folder).is_file()
+        and header_path(sound_name, folder).is_file()
+    )
+
+
+def write_pcm(sound: AudioSegment, sound_name: str, folder: Path = PROCESSED_FOLDER):
+    """Dump decoded samples of a source to a flat file with a small json header."""
+    write_pcm_blocks([sound], sound_name, folder)
+
+
+def write_pcm_blocks(
+    blocks: Iterable[AudioSegment], sound_name: str, folder: Path = PROCESSED_FOLDER
+) -> int:
+    """
+    Same as write_pcm, for a source arriving as consecutive blocks of the same format.
+    Returns the length of the source in ms. Both files are written aside and renamed
+    into place: workers keep reading the store they mapped, and an interrupted rerun
+    leaves the previous store whole.
+    """
+    print(f"Writing raw samples of {sound_name}...")
+    header: Dict[str, Any] = {"frame_count": 0}
+    with atomic_path(pcm_path(sound_name, folder)) as temp_path:
+        with open(temp_path, "wb") as f:
+            for block in blocks:
+                header["frame_rate"] = block.frame_rate
+                header["channels"] = block.channels
+                header["sample_width"] = block.sample_width
+                header["frame_count"] += int(block.frame_count())
+                f.write(block.raw_data)
+    write_atomic(header_path(sound_name, folder), json.dumps(header))
+    return round(1000 * header["frame_count"] / header["frame_rate"])
+
+
+def load_header(sound_name: str, folder: Path = PROCESSED_FOLDER) -> Dict[str, Any]:
+    return json.load(open(header_path(sound_name, folder)))
+
+
+def _open_map(sound_name: str, folder: Path) -> np.memmap:
+    path: Path = pcm_path(sound_name, folder)
+    mtime: int = path.stat().st_mtime_ns
+    if path not in _MAPS or _MAPS[path][0] != mtime:
+        _MAPS[path] = (mtime, np.memmap(path, dtype=np.uint8, mode="r"))
+    return _MAPS[path][1]
+
+
+def pcm_slice(
+    start: int, end: int, sound_name: str, folder: Path = PROCESSED_FOLDER
+) -> AudioSegment:
+    """Return [start, end] (in ms, end inclusive like file_finder), decoding nothing."""
+    header: Dict[str, Any] = load_header(sound_name, folder)
+    frame_rate: int = header["frame_rate"]
+    frame_width: int = header["channels"] * header["sample_width"]
+
+    start_frame: int = min(start * frame_rate // 1000, header["frame_count"])
+    end_frame: int = min((end + 1) * frame_rate // 1000, header["frame_count"])
+
+    samples: np.memmap = _open_map(sound_name, folder)
+    return AudioSegment(
+        data=samples[start_frame * frame_width : end_frame * frame_width].tobytes(),
+        sample_width=header["sample_width"],
+        frame_rate=frame_rate,
+        channels=header["channels"],
+    )
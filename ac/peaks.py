@@ -0,0 +1,156 @@
+"""Multi-resolution min/max/RMS waveform pyramids, to draw audio without decoding it."""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from pathlib import Path
+import json
+
+import numpy as np
+from pydub import AudioSegment
+
+from constants import PROCESSED_FOLDER, PEAKS_SUFFIX, PEAK_LEVELS
+
+
+SAMPLE_TYPES: Dict[int, Any] = {1: np.int8, 2: np.int16, 4: np.int32}
+# Levels are stored as int16 rows of (min, max, rms), scaled from [-1, 1].
+SCALE: int = 32767
+
+
+def peaks_folder(sound_name: str, folder: Path = PROCESSED_FOLDER) -> Path:
+    return folder.joinpath(sound_name + PEAKS_SUFFIX)
+
+
+def has_peaks(sound_name: str, folder: Path = PROCESSED_FOLDER) -> bool:
+    return peaks_folder(sound_name, folder).joinpath("meta.json").is_file()
+
+
+def normalized_samples(sound: AudioSegment) -> np.ndarray:
+    """Samples as floats in [-1, 1], one column per channel."""
+    samples: np.ndarray = np.frombuffer(
+        sound.raw_data, dtype=SAMPLE_TYPES[sound.sample_width]
+    ).reshape(-1, sound.channels)
+    return samples.astype(np.float32) / 2 ** (8 * sound.sample_width - 1)
+
+
+class PeakBuilder:
+    """Accumulate consecutive blocks of a source into the finest pyramid level."""
+
+    def __init__(self):
+        self.frame_rate: Optional[int] = None
+        self.rest: Optional[np.ndarray] = None
+        self.mins: List[np.ndarray] = []
+        self.maxs: List[np.ndarray] = []
+        self.squares: List[np.ndarray] = []
+        self.frame_count: int = 0
+
+    def add(self, sound: AudioSegment):
+        self.frame_rate = sound.frame_rate
+        samples: np.ndarray = normalized_samples(sound)
+        self.frame_count += len(samples)
+        if self.rest is not None:
+            samples = np.concatenate([self.rest, samples])
+
+        # Keep what does not fill a whole bucket for the next block.
+        size: int = PEAK_LEVELS[0]
+        whole: int = len(samples) // size * size
+        self._reduce(samples[:whole].reshape(-1, size * samples.shape[1]))
+        self.rest = samples[whole:]
+
+    def watch(self, blocks: Iterable[AudioSegment]) -> Iterator[AudioSegment]:
+        """Pass blocks on, adding each on the way, so the pyramid needs no decode."""
+        for block in blocks:
+            self.add(block)
+            yield block
+
+    def _reduce(self, buckets: np.ndarray):
+        self.mins.append(buckets.min(axis=1))
+        self.maxs.append(buckets.max(axis=1))
+        self.squares.append(np.square(buckets).mean(axis=1))
+
+    def save(self, sound_name: str, folder: Path = PROCESSED_FOLDER):
+        if self.rest is not None and len(self.rest):
+            self._reduce(self.rest.reshape(1, -1))
+            self.rest = None
+
+        path: Path = peaks_folder(sound_name, folder)
+        path.mkdir(parents=True, exist_ok=True)
+        mins: np.ndarray = np.concatenate(self.mins)
+        maxs: np.ndarray = np.concatenate(self.maxs)
+        squares: np.ndarray = np.concatenate(self.squares)
+
+        for level in PEAK_LEVELS:
+            # Each level merges groups of buckets of the finest one.
+            starts: np.ndarray = np.arange(0, len(mins), level // PEAK_LEVELS[0])
+            counts: np.ndarray = np.diff(np.append(starts, len(mins)))
+            rows: np.ndarray = np.stack(
+                [
+                    np.minimum.reduceat(mins, starts),
+                    np.maximum.reduceat(maxs, starts),
+                    np.sqrt(np.add.reduceat(squares, starts) / counts),
+                ],
+                axis=1,
+            )
+            np.save(
+                path.joinpath(f"level_{level}.npy"),
+                np.round(np.clip(rows, -1, 1) * SCALE).astype(np.int16),
+            )
+        json.dump(
+            {
+                "frame_rate": self.frame_rate,
+                "frame_count": self.frame_count,
+                "levels": PEAK_LEVELS,
+            },
+            open(path.joinpath("meta.json"), "w"),
+        )
+
+
+def write_peaks(
+    blocks: Iterable[AudioSegment], sound_name: str, folder: Path = PROCESSED_FOLDER
+):
+    """Build and save the pyramid of a source given as consecutive blocks."""
+    print(f"Computing waveform peaks of {sound_name}...")
+    builder = PeakBuilder()
+    for block in blocks:
+        builder.add(block)
+    builder.save(sound_name, folder)
+
+
+def peaks_duration(sound_name: str, folder: Path = PROCESSED_FOLDER) -> int:
+    """Length of a source in ms, from its pyramid."""
+    path: Path = peaks_folder(sound_name, folder)
+    meta: Dict[str, Any] = json.load(open(path.joinpath("meta.json")))
+    return meta["frame_count"] * 1000 // meta["frame_rate"]
+
+
+def peak_range(
+    sound_name: str,
+    start: int,
+    end: int,
+    max_buckets: int,
+    folder: Path = PROCESSED_FOLDER,
+) -> Dict[str, np.ndarray]:
+    """
+    Peaks of [start, end] (in ms) from the finest level giving at most max_buckets
+    buckets. Levels are memory-mapped, so only the requested rows are read.
+    """
+    path: Path = peaks_folder(sound_name, folder)
+    meta: Dict[str, Any] = json.load(open(path.joinpath("meta.json")))
+    frame_rate: int = meta["frame_rate"]
+    first: int = max(0, start) * frame_rate // 1000
+    last: int = min(meta["frame_count"], end * frame_rate // 1000)
+
+    level: int = meta["levels"][-1]
+    for candidate in meta["levels"]:
+        if (last - first) / candidate <= max_buckets:
+            level = candidate
+            break
+
+    rows: np.ndarray = np.load(path.joinpath(f"level_{level}.npy"), mmap_mode="r")
+    first_row: int = min(first // level, len(rows))
+    last_row: int = min(max(first_row + 1, -(-last // level)), len(rows))
+    block: np.ndarray = np.asarray(rows[first_row:last_row], dtype=np.float32) / SCALE
+    return {
+        "time": np.arange(first_row, last_row) * level * 1000 / frame_rate,  # in ms
+        "min": block[:, 0],
+        "max": block[:, 1],
+        "rms": block[:, 2],
+    }
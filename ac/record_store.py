@@ -0,0 +1,288 @@
+"""Clip records, in SQLite so every process shares them and submits stay cheap."""
+
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple
+from pathlib import Path
+import os
+import sqlite3
+import threading
+
+from timefmt import formatter_lv0
+import search_index
+
+# pandas alone takes longer to import than the rest of the app, and is only needed to
+# read legacy csv files and export records; it is imported where used.
+if TYPE_CHECKING:
+    import pandas as pd
+
+DEFAULT_COLS: List[str] = [
+    "Index",
+    "Title",
+    "Quotes",
+    "Source",
+    "Length",
+    "Edits",
+    "Time",
+    "Submission",
+]
+
+# Comparisons a record query may filter with.
+FILTER_OPERATORS: Dict[str, str] = {
+    "eq": "=",
+    "ne": "!=",
+    "lt": "<",
+    "le": "<=",
+    "gt": ">",
+    "ge": ">=",
+    "contains": "LIKE",
+    "datestartswith": "LIKE",
+}
+
+# Bumped by migrations; 1 once legacy csv records were imported.
+SCHEMA_VERSION: int = 1
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS records (
+    "Index" INTEGER PRIMARY KEY,
+    Title TEXT NOT NULL,
+    Quotes TEXT NOT NULL,
+    Source TEXT NOT NULL,
+    Length TEXT NOT NULL,
+    Edits INTEGER NOT NULL DEFAULT 0,
+    Time TEXT NOT NULL,
+    Submission TEXT NOT NULL,
+    start_ms INTEGER NOT NULL DEFAULT 0,
+    end_ms INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS records_source ON records (Source);
+"""
+
+
+class Record(NamedTuple):
+    """One clip record, with its Time range parsed into ms."""
+
+    index: int
+    title: str
+    quote: str
+    source: str
+    length: str
+    edits: int
+    time: str
+    submission: str
+    start_ms: int
+    end_ms: int
+
+
+def time_range(time_str: str) -> List[int]:
+    """Start and end (in ms) of a Time string."""
+    start, end, _ = formatter_lv0(time_str.replace(" ", ""))
+    return [start, end]
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class RecordStore:
+    """Records table in WAL mode: readers never block the writer, nor it the readers."""
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+        # sqlite3 connections may not be shared between threads, nor with forked ones.
+        self._local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            conn.executescript(search_index.SCHEMA)
+            self._add_time_columns(conn)
+            search_index.index_missing(conn)
+
+    def _add_time_columns(self, conn: sqlite3.Connection):
+        """Stores made before records kept their parsed time range get it backfilled."""
+        if "start_ms" in self._columns(conn):
+            return
+        # Another process may be upgrading the store too; check again under its lock.
+        conn.execute("BEGIN IMMEDIATE")
+        if "start_ms" in self._columns(conn):
+            conn.commit()
+            return
+        conn.execute(
+            "ALTER TABLE records ADD COLUMN start_ms INTEGER NOT NULL DEFAULT 0"
+        )
+        conn.execute("ALTER TABLE records ADD COLUMN end_ms INTEGER NOT NULL DEFAULT 0")
+        conn.executemany(
+            'UPDATE records SET start_ms = ?, end_ms = ? WHERE "Index" = ?',
+            [
+                time_range(row["Time"]) + [row["Index"]]
+                for row in conn.execute('SELECT "Index", Time FROM records')
+            ],
+        )
+        conn.commit()
+
+    @staticmethod
+    def _columns(conn: sqlite3.Connection) -> List[str]:
+        return [row["name"] for row in conn.execute("PRAGMA table_info(records)")]
+
+    def connection(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add(self, entry: Dict[str, Any]) -> int:
+        """Insert a record under the next free index, picked in the same statement."""
+        with self.connection() as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO records
+                ("Index", Title, Quotes, Source, Length, Edits, Time, Submission,
+                 start_ms, end_ms)
+                SELECT COALESCE(MAX("Index"), -1) + 1, ?, ?, ?, ?, ?, ?, ?, ?, ?
+                FROM records
+                """,
+                [entry[col] for col in DEFAULT_COLS[1:]] + time_range(entry["Time"]),
+            )
+            # Indexed in the same transaction, so searches never miss a record.
+            search_index.index_record(
+                conn, cursor.lastrowid, entry["Title"], entry["Quotes"]
+            )
+        return cursor.lastrowid
+
+    def get(self, index: int) -> Optional[Record]:
+        """Primary key lookup."""
+        row: Optional[sqlite3.Row] = (
+            self.connection()
+            .execute('SELECT * FROM records WHERE "Index" = ?', [index])
+            .fetchone()
+        )
+        return None if row is None else Record(*row)
+
+    def page(
+        self,
+        offset: int,
+        limit: int,
+        sort_by: List[Tuple[str, bool]] = (),
+        filters: List[Tuple[str, str, Any]] = (),
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        One page of the records matching all filters, as (column, operator, value) with
+        operators from FILTER_OPERATORS, sorted by (column, ascending) pairs; and how
+        many records match. Columns are checked against DEFAULT_COLS.
+        """
+        where: List[str] = []
+        params: List[Any] = []
+        for column, operator, value in filters:
+            if column not in DEFAULT_COLS or operator not in FILTER_OPERATORS:
+                raise ValueError(f"Unsupported filter: {column} {operator}")
+            if operator == "contains":
+                where.append(f"\"{column}\" LIKE ? ESCAPE '\\'")
+                value = "%" + _escape_like(str(value)) + "%"
+            elif operator == "datestartswith":
+                where.append(f"\"{column}\" LIKE ? ESCAPE '\\'")
+                value = _escape_like(str(value)) + "%"
+            else:
+                where.append(f'"{column}" {FILTER_OPERATORS[operator]} ?')
+            params.append(value)
+        where_sql: str = f"WHERE {' AND '.join(where)}" if where else ""
+
+        order: List[str] = []
+        for column, ascending in sort_by:
+            if column not in DEFAULT_COLS:
+                raise ValueError(f"Unsupported sort column: {column}")
+            order.append(f'"{column}" {"ASC" if ascending else "DESC"}')
+        order.append('"Index" ASC')  # Stable pages.
+
+        conn: sqlite3.Connection = self.connection()
+        count: int = conn.execute(
+            f"SELECT COUNT(*) FROM records {where_sql}", params
+        ).fetchone()[0]
+        columns: str = ", ".join(f'"{column}"' for column in DEFAULT_COLS)
+        rows: List[Dict[str, Any]] = [
+            dict(row)
+            for row in conn.execute(
+                f"SELECT {columns} FROM records {where_sql} "
+                f"ORDER BY {', '.join(order)} LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            )
+        ]
+        return rows, count
+
+    def search(self, query: str, limit: int = 10) -> List[Record]:
+        """Records best matching query in their quote or title, best first."""
+        ranked: List[Tuple[int, float]] = search_index.search(
+            self.connection(), query, limit
+        )
+        records: List[Record] = []
+        for index, _ in ranked:
+            record: Optional[Record] = self.get(index)
+            if record is not None:
+                records.append(record)
+        return records
+
+    def frame(self) -> "pd.DataFrame":
+        """All records, in submission order."""
+        import pandas as pd
+
+        return pd.read_sql_query(
+            'SELECT * FROM records ORDER BY "Index"', self.connection()
+        )[DEFAULT_COLS]
+
+    def migrate(self, records_csv: Path, legacy_export: Path):
+        """
+        One-time import of the records.csv written before this store, keeping its
+        indices, then of the tab-separated data/export.csv of the first version of the
+        app, whose rows get new indices.
+        """
+        conn: sqlite3.Connection = self.connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        # New stores have nothing to import, and start without pandas.
+        if records_csv.is_file() or legacy_export.is_file():
+            import pandas as pd
+
+        rows: List[List[Any]] = []
+        if records_csv.is_file():
+            df: pd.DataFrame = pd.read_csv(records_csv, index_col=[0])
+            df = df.fillna({"Edits": 0}).fillna("")
+            df["Edits"] = df["Edits"].astype(int)
+            rows = [
+                row + time_range(row[6])
+                for row in df[DEFAULT_COLS].astype(object).values.tolist()
+            ]
+        next_index: int = max([row[0] + 1 for row in rows], default=0)
+
+        if legacy_export.is_file():
+            legacy: pd.DataFrame = pd.read_csv(legacy_export, sep="\t")
+            for _, row in legacy.iterrows():
+                # Clips were named after their time range, e.g. 23_08-23_11_2011.mp3.
+                title: str = Path(str(row["Download"])).stem.rsplit("_", 1)[0]
+                rows.append(
+                    [
+                        next_index,
+                        title,
+                        row["Quotes"],
+                        str(row["Source"]),
+                        row["Length"],
+                        int(row["Edits"]) if "Edits" in row else 0,
+                        row["Time"],
+                        row["Submission"],
+                    ]
+                    + time_range(row["Time"])
+                )
+                next_index += 1
+
+        with conn:
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO records
+                ("Index", Title, Quotes, Source, Length, Edits, Time, Submission,
+                 start_ms, end_ms)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            search_index.index_missing(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
@@ -1,8 +1,9 @@
 #!/usr/bin/env python
+"""Import records.csv and the legacy data/export.csv into the record store, once."""
 
-import pandas as pd
+from constants import ASSET_FOLDER, RECORD_DB, LEGACY_EXPORT
+from record_store import RecordStore
 
-df = pd.read_csv('data/export.csv',sep='\t')
-df['Index'] = range(1,df.shape[0]+1)
-df['Edits'] = [0] * df.shape[0]
-df.to_csv('data/export.csv', sep='\t', index=False)
+store = RecordStore(RECORD_DB)
+store.migrate(ASSET_FOLDER.joinpath("records.csv"), LEGACY_EXPORT)
+print(f"{len(store.frame())} records in {RECORD_DB}.")
@@ -0,0 +1,124 @@
+"""Disk cache of rendered cuts and their previews, keyed by source content and cut."""
+
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+import hashlib
+import json
+import os
+
+from constants import (
+    PROCESSED_FOLDER,
+    RENDER_CACHE_FOLDER,
+    RENDER_CACHE_BYTES,
+    RENDER_CACHE_CHECK_BYTES,
+)
+from manifest import load_manifest
+from atomic_files import write_atomic
+
+CLIP_SUFFIX: str = ".mp3"
+# Renamed whenever previews are drawn differently; stale ones age out of the cache.
+PREVIEW_SUFFIX: str = ".preview.v2.json"
+
+# Bytes this process wrote to each cache folder since it last checked the cache size.
+_unchecked: Dict[Path, int] = {}
+
+
+def render_key(
+    sound_name: str,
+    start: int,
+    end: int,
+    mono: bool,
+    codec: Dict[str, Any],
+    folder: Path = PROCESSED_FOLDER,
+) -> Optional[str]:
+    """
+    Hash of what a cut depends on: the processed source, as described by its manifest,
+    and the cut parameters, including the export settings (codec). Sources without a
+    finished manifest are not cached.
+    """
+    manifest: Optional[Dict[str, Any]] = load_manifest(sound_name, folder)
+    if manifest is None or not manifest["complete"]:
+        return None
+    params: Dict[str, Any] = {
+        "source": sound_name,
+        "content_hash": manifest["content_hash"],
+        "layout": manifest["layout"],
+        "split_interval": manifest["split_interval"],
+        "codec": manifest["codec"],
+        "start": start,
+        "end": end,
+        "mono": mono,
+        "rendition": codec,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def _read(path: Path) -> Optional[bytes]:
+    try:
+        data: bytes = path.read_bytes()
+        os.utime(path)  # Recently used entries are evicted last.
+    except FileNotFoundError:  # Never cached, or just evicted.
+        return None
+    return data
+
+
+def _write(path: Path, data: bytes, folder: Path):
+    """
+    Write through a temp file, so readers in other processes never see half an entry;
+    the cache size is checked each time this process wrote RENDER_CACHE_CHECK_BYTES.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    write_atomic(path, data)
+    unchecked: Optional[int] = _unchecked.get(folder)
+    if unchecked is None or unchecked + len(data) >= RENDER_CACHE_CHECK_BYTES:
+        evict(folder=folder)
+        _unchecked[folder] = 0
+    else:
+        _unchecked[folder] = unchecked + len(data)
+
+
+def clip_path(key: str, folder: Path = RENDER_CACHE_FOLDER) -> Path:
+    return folder.joinpath(key + CLIP_SUFFIX)
+
+
+def load_clip(key: str, folder: Path = RENDER_CACHE_FOLDER) -> Optional[bytes]:
+    return _read(clip_path(key, folder))
+
+
+def save_clip(key: str, clip: bytes, folder: Path = RENDER_CACHE_FOLDER):
+    _write(clip_path(key, folder), clip, folder)
+
+
+def load_preview(
+    key: str, folder: Path = RENDER_CACHE_FOLDER
+) -> Optional[Dict[str, Any]]:
+    data: Optional[bytes] = _read(folder.joinpath(key + PREVIEW_SUFFIX))
+    return None if data is None else json.loads(data)
+
+
+def save_preview(key: str, figure_json: str, folder: Path = RENDER_CACHE_FOLDER):
+    _write(folder.joinpath(key + PREVIEW_SUFFIX), figure_json.encode(), folder)
+
+
+def evict(max_bytes: int = RENDER_CACHE_BYTES, folder: Path = RENDER_CACHE_FOLDER):
+    """Remove least recently used entries until the cache fits in max_bytes."""
+    entries: List[Tuple[float, int, str]] = []
+    for entry in os.scandir(folder):
+        if entry.name.endswith(".part"):
+            continue
+        try:
+            stat: os.stat_result = entry.stat()
+        except FileNotFoundError:  # Evicted by another process.
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+
+    total: int = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        total -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:  # Evicted by another process.
+            pass
@@ -0,0 +1,29 @@
+"""Plain HTTP routes served next to the app."""
+
+from pathlib import Path
+import re
+
+from dash import Dash
+from flask import abort, send_file
+
+from constants import RENDER_CACHE_FOLDER
+from render_cache import clip_path
+
+CLIP_ID_PATTERN = re.compile(r"[0-9a-f]{32,64}")
+
+
+def clip_url(clip_id: str) -> str:
+    """Where the player gets a clip; a new cut is a new id, so no cache busting."""
+    return f"/clips/{clip_id}.mp3"
+
+
+def add_routes(app: Dash):
+    @app.server.route("/clips/<clip_id>.mp3")
+    def serve_clip(clip_id: str):
+        """Stream a rendered clip from the render cache, with Range requests to seek."""
+        if not CLIP_ID_PATTERN.fullmatch(clip_id):
+            abort(404)
+        path: Path = clip_path(clip_id, RENDER_CACHE_FOLDER)
+        if not path.is_file():  # Evicted since it was cut.
+            abort(404)
+        return send_file(path, mimetype="audio/mpeg", conditional=True, max_age=3600)
@@ -1,48 +1,43 @@
 """Class to control runtime IO."""
 
 from pathlib import Path
-from typing import Any, Dict, Tuple, List
+from typing import Any, Dict, Optional, List, Tuple
+from io import BytesIO
 import json
-import tempfile
-import shutil
-import datetime
-import os
+import re
 
-import pandas as pd
+import numpy as np
+from pydub import AudioSegment
 
-from constants import ASSET_FOLDER, TEMP_PREFIX
-
-DEFAULT_COLS: List[str] = [
-    "Index",
-    "Title",
-    "Quotes",
-    "Source",
-    "Length",
-    "Edits",
-    "Time",
-    "Submission",
-]
+from constants import (
+    ASSET_FOLDER,
+    RECORD_DB,
+    LEGACY_EXPORT,
+    SAVED_PEAKS_SUFFIX,
+)
+from record_store import Record, RecordStore
+from manifest import manifest_path, processed_sources
+from atomic_files import write_atomic
+from cutter import render_clip, cut_record
+from utils import preview_peaks
 
 
 class EntryNotFoundError(Exception):
     pass
 
 
-class Control:
-    def __init__(self):
-        # Check or make record files.
-        self.index_file: Path = ASSET_FOLDER.joinpath("index.json")
-        self.df_file: Path = ASSET_FOLDER.joinpath("records.csv")
+class InvalidEntryError(Exception):
+    pass
 
-        # Create placeholders for paths
-        self.temp_dir: Path = Path(tempfile.mkdtemp())
-        self.temp_pointer: Path = None
-        self.parent: Path = Path(__file__).parent
 
-        # Resume previous records.
-        self.current_index: int = self.load_index()
-        self.df: pd.DataFrame = self.load_df()
-        self.current_entry: Dict[str, Any] = None
+class Control:
+    def __init__(self, parent: Path = ASSET_FOLDER.parent, record_db: Path = RECORD_DB):
+        """parent holds the assets folder the app serves; record_db is the store."""
+        self.parent: Path = parent
+
+        # Check or make record files.
+        self.store: RecordStore = RecordStore(record_db)
+        self.store.migrate(self.parent.joinpath("assets/records.csv"), LEGACY_EXPORT)
 
         # Check or create necessary folders.
         self.check_folders()
@@ -51,151 +46,146 @@ class Control:
         """Check existing files and create folders if necessary."""
         p_folder: Path = self.parent.joinpath("assets/processed")
         s_folder: Path = self.parent.joinpath("assets/saves")
-        t_folder: Path = self.parent.joinpath("assets/temp")
 
-        for folder in [p_folder, s_folder, t_folder]:
+        for folder in [p_folder, s_folder]:
             folder.mkdir(parents=True, exist_ok=True)
 
-        if len(list(p_folder.glob("*.mp3"))) == 0:
-            raise FileNotFoundError(f"No processed files found in {p_folder}.")
-        self.remove_temp_files()
-
-    def remove_temp_files(self):
-        """Clean temp folder."""
-        for temp_path in self.parent.joinpath("assets/temp/").glob(
-            TEMP_PREFIX + "*.mp3"
-        ):
-            os.remove(temp_path)
-
-    def load_index(self) -> int:
-        index: int = -1
-        if not self.index_file.is_file():
-            json.dump(-1, open(self.index_file, "w"))
-        else:
-            index = json.load(open(self.index_file))
-        return index + 1
-
-    def update_index(self):
-        json.dump(self.current_index, open(self.index_file, "w"))
-
-    def load_df(self) -> pd.DataFrame:
-        if not self.df_file.is_file():
-            df: pd.DataFrame = pd.DataFrame()
-            df[DEFAULT_COLS] = None
-        else:
-            df = pd.read_csv(self.df_file, index_col=[0])
-        return df
-
-    def update_df(self):
-        self.df.to_csv(self.df_file)
-
-    def update_temp_entry(self, new_entry: Dict[str, Any]):
+        # A source processed to the end will do, or a chunk of one processed before
+        # manifests existed; stopping at the first keeps startup flat as the archive
+        # grows. Chunks of unfinished runs do not count.
+        if next(processed_sources(p_folder), None) is not None:
+            return
+        for path in p_folder.glob("*.mp3"):
+            # A whole-source mp3 is named after its source; chunks end in _i_interval.
+            names: List[str] = [path.stem, path.name.rsplit("_", 2)[0]]
+            if not any(manifest_path(name, p_folder).is_file() for name in names):
+                return
+        raise FileNotFoundError(f"No processed files found in {p_folder}.")
+
+    @staticmethod
+    def checked_entry(pending: Dict[str, Any]) -> Dict[str, Any]:
         """
-        The player (or browser) would automatically cache seen path to audio files.
-        In order to refresh it every time we generate a cut audio, we need to have a different
-        name.
+        The record to save for a pending entry sent back by the browser: rebuilt from
+        its source, time range, title and quote, each checked, with the rest derived
+        here. Raises InvalidEntryError if any of them is missing or invalid.
         """
-        if self.temp_pointer is not None:
-            old_file_path: Path = self.parent.joinpath(self.temp_pointer)
-            if old_file_path.is_file():
-                os.remove(old_file_path)
-
-        temp_file_name: str = TEMP_PREFIX + datetime.datetime.now().strftime(
-            "%Y_%m_%d_%H_%M_%S_%f"
-        )
-        shutil.move(
-            self.parent.joinpath("assets/temp/temp.mp3"),
-            self.parent.joinpath(f"assets/temp/{temp_file_name}.mp3"),
-        )
-        self.temp_pointer = f"assets/temp/{temp_file_name}.mp3"
-
-        self.current_entry = new_entry
-        return self.temp_pointer
-
-    def add_entry(self) -> str:
+        try:
+            source, time_str, title, quote = (
+                pending[key] for key in ["Source", "Time", "Title", "Quotes"]
+            )
+        except (KeyError, TypeError):
+            raise InvalidEntryError("Incomplete entry.")
+        if not all(isinstance(x, str) for x in [source, time_str, title, quote]):
+            raise InvalidEntryError("Entry fields must be strings.")
+        # Both name the saved file.
+        if not re.fullmatch(r"\w+", source) or re.search(r"[/\\\0]", title):
+            raise InvalidEntryError(f"Invalid source or title: {source!r}, {title!r}.")
+        if "\n" in quote:
+            raise InvalidEntryError("Quote cannot exceed one line.")
+        try:
+            return cut_record(source, time_str, quote, title, edits=0)
+        except (ValueError, AssertionError, IndexError):
+            raise InvalidEntryError(f"Invalid time range: {time_str!r}.")
+
+    def add_entry(self, pending: Dict[str, Any]) -> Tuple[int, str]:
         """
-        Submit current (temp) entry to df and give the temp audio file a name.
-        Returns finalized path of moved audio file.
+        Submit a pending entry (kept by the browser session that cut it) to the record
+        store and render its audio at full quality, the player having only had a preview
+        rendition. Returns the index of the record and finalized path of the saved audio
+        file. Raises InvalidEntryError for entries checked_entry rejects.
         """
-        if self.current_entry is None:
-            return ""
-
-        # Complete df entry dict, and update df.
-        new_entry: Dict[str, Any] = self.current_entry
-        new_entry["Index"] = self.current_index
-        self.df = pd.concat(
-            [
-                self.df,
-                pd.DataFrame.from_dict([new_entry], orient="columns"),
-            ]
-        )
-        self.df = self.df[DEFAULT_COLS]
-        # Now update index and save stuffs to disk.
-        self.current_index += 1
-        self.update_index()
-        self.update_df()
-        # Save the audio file.
+        new_entry: Dict[str, Any] = self.checked_entry(pending)
+        # Save the audio file first, so a cut failing to render leaves no record behind.
         new_url: Path = f"assets/saves/{new_entry['Title']}_{new_entry['Source']}.mp3"
-        shutil.copy(
-            self.parent.joinpath(self.temp_pointer),
-            self.parent.joinpath(new_url),
+        audio_obj, clip, _ = render_clip(
+            video_name=new_entry["Source"],
+            time_str=new_entry["Time"],
+            mono=False,
+            folder=self.parent.joinpath("assets/processed"),
+            cache_folder=self.parent.joinpath("assets/renders"),
         )
-        # Remove previous temp files.
-        self.remove_temp_files()
-
-        # Clear current entry to prevent duplicates.
-        self.current_entry = None
+        self.parent.joinpath(new_url).write_bytes(clip)
+        # Cached renditions come back encoded only.
+        if audio_obj is None:
+            audio_obj = AudioSegment.from_file(BytesIO(clip), format="mp3")
+        self.write_peaks(new_url, audio_obj)
+        # The store allocates the index, atomically across threads and processes.
+        index: int = self.store.add(new_entry)
+
+        return index, new_url
+
+    def write_peaks(self, saved_url: str, audio_obj: AudioSegment) -> Dict[str, Any]:
+        """Keep the wave plot columns of a saved clip in a sidecar, for Load to read."""
+        peaks: Dict[str, Any] = {
+            key: np.round(value, 4).tolist() if key != "duration" else value
+            for key, value in preview_peaks(audio_obj).items()
+        }
+        sidecar: Path = self.parent.joinpath(saved_url).with_suffix(SAVED_PEAKS_SUFFIX)
+        write_atomic(sidecar, json.dumps(peaks))
+        return peaks
 
-        return new_url
+    def saved_peaks(self, saved_url: str) -> Dict[str, Any]:
+        """
+        Wave plot columns of a saved clip, from its sidecar. Clips saved before sidecars
+        existed, or rewritten since, are decoded once and get a new one. Records whose
+        clip is missing (e.g. imported from the legacy export) get no columns.
+        """
+        path: Path = self.parent.joinpath(saved_url)
+        sidecar: Path = path.with_suffix(SAVED_PEAKS_SUFFIX)
+        try:
+            if sidecar.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+                return json.loads(sidecar.read_text())
+        except FileNotFoundError:
+            pass
+        try:
+            audio_obj: AudioSegment = AudioSegment.from_file(path)
+        except FileNotFoundError:
+            return {"time": [], "min": [], "max": [], "duration": 0}
+        return self.write_peaks(saved_url, audio_obj)
+
+    def player_url(self, saved_url: str) -> str:
+        """
+        The player (or browser) would automatically cache seen path to audio files; a
+        saved file gets a new url whenever it is rewritten. A missing file gets no url.
+        """
+        try:
+            version: int = self.parent.joinpath(saved_url).stat().st_mtime_ns
+        except FileNotFoundError:
+            return ""
+        return f"{saved_url}?v={version}"
 
     def load_entry(self, index: int):
-        """Use an index to load an audio piece and meta."""
+        """Use an index to load an audio piece and meta, and the entry to resubmit."""
         assert isinstance(index, int), f"Unexpected index type: {type(index)}."
 
-        _record: List[Dict[str, Any]] = self.df[self.df["Index"].isin([index])].to_dict(
-            "records"
-        )
-        if len(_record) != 1:
+        record: Optional[Record] = self.store.get(index)
+        if record is None:
             raise EntryNotFoundError
-        record: Dict[str, Any] = _record[0]
 
-        times: List[str] = record["Time"].split("-")
         # start_min, sec, msec, end_min, sec, msec
-        entry_times: List[int] = Control.split_time(times[0]) + Control.split_time(
-            times[1]
+        entry_times: List[int] = Control.split_ms(record.start_ms) + Control.split_ms(
+            record.end_ms
         )
 
-        quote: str = record["Quotes"]
-        title: str = record["Title"]
-        video: str = record["Source"]
-
-        # Copy original audio to a temp one and get address.
-        audio_short_url: str = f"assets/saves/{record['Title']}_{record['Source']}.mp3"
-        temp_file_name: str = TEMP_PREFIX + datetime.datetime.now().strftime(
-            "%Y_%m_%d_%H_%M_%S_%f"
-        )
-        shutil.copy(
-            self.parent.joinpath(audio_short_url),
-            self.parent.joinpath(f"assets/temp/{temp_file_name}.mp3"),
-        )
-        self.temp_pointer = f"assets/temp/{temp_file_name}.mp3"
-
-        # Update current pointer.
-        self.current_entry = {
-            "Title": title,
-            "Quotes": quote,
-            "Time": record["Time"],
-            "Length": record["Length"],
-            "Submission": record["Submission"],
-            "Source": str(video),
+        audio_short_url: str = f"assets/saves/{record.title}_{record.source}.mp3"
+        entry: Dict[str, Any] = {
+            "Title": record.title,
+            "Quotes": record.quote,
+            "Time": record.time,
+            "Length": record.length,
+            "Submission": record.submission,
+            "Source": record.source,
             "Edits": 0,
         }
 
         return (
-            entry_times + [quote, title, video],
-            self.temp_pointer,
+            entry_times + [record.quote, record.title, record.source],
+            audio_short_url,
+            entry,
         )
 
     @staticmethod
-    def split_time(time_str: str) -> Tuple[int, int, int]:
-        return [str(x) for x in time_str.split(":")]
+    def split_ms(ms: int) -> List[int]:
+        """Minutes, seconds and milliseconds of a time in ms."""
+        seconds, msec = divmod(ms, 1000)
+        return [*divmod(seconds, 60), msec]
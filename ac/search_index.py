@@ -0,0 +1,128 @@
+"""Inverted index over record quotes and titles, ranked with BM25, in the record db."""
+
+from typing import Dict, List, Tuple
+from collections import Counter
+import math
+import re
+import sqlite3
+
+# Title terms count as much as this many quote terms.
+TITLE_WEIGHT: float = 2.0
+# BM25 term frequency saturation and length normalization.
+K1: float = 1.2
+B: float = 0.75
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    record INTEGER NOT NULL,
+    tf REAL NOT NULL,
+    PRIMARY KEY (term, record)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS search_docs (
+    record INTEGER PRIMARY KEY,
+    length REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS search_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    docs INTEGER NOT NULL,
+    total_length REAL NOT NULL
+);
+INSERT OR IGNORE INTO search_stats VALUES (0, 0, 0);
+"""
+
+# Latin words and digits, or runs of CJK characters.
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased words for latin text; for Chinese, which has no spaces, every character
+    and every pair of neighbouring characters, so single characters and words match.
+    """
+    tokens: List[str] = []
+    for run in TOKEN_PATTERN.findall(str(text).lower()):
+        if run[0].isascii():
+            tokens.append(run)
+        else:
+            tokens.extend(run)
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def index_record(conn: sqlite3.Connection, record: int, title: str, quote: str):
+    """Add one record to the index, inside the caller's transaction."""
+    counts: Dict[str, float] = Counter(tokenize(quote))
+    for term in tokenize(title):
+        counts[term] = counts.get(term, 0) + TITLE_WEIGHT
+    length: float = sum(counts.values())
+
+    conn.executemany(
+        "INSERT OR REPLACE INTO postings (term, record, tf) VALUES (?, ?, ?)",
+        [(term, record, tf) for term, tf in counts.items()],
+    )
+    conn.execute(
+        "INSERT INTO search_docs (record, length) VALUES (?, ?)", (record, length)
+    )
+    conn.execute(
+        "UPDATE search_stats SET docs = docs + 1, total_length = total_length + ? "
+        "WHERE id = 0",
+        (length,),
+    )
+
+
+def index_missing(conn: sqlite3.Connection):
+    """Index the records the index does not have yet, e.g. right after a migration."""
+    if not conn.in_transaction:
+        # Look them up under the write lock, so two processes never both add them.
+        conn.execute("BEGIN IMMEDIATE")
+    rows: List[sqlite3.Row] = conn.execute(
+        'SELECT "Index", Title, Quotes FROM records '
+        'WHERE "Index" NOT IN (SELECT record FROM search_docs)'
+    ).fetchall()
+    for row in rows:
+        index_record(conn, row[0], row[1], row[2])
+
+
+def search(conn: sqlite3.Connection, query: str, limit: int) -> List[Tuple[int, float]]:
+    """Best matching records of query, as (record, score), reading only its postings."""
+    terms: List[str] = list(dict.fromkeys(tokenize(query)))
+    docs, total_length = conn.execute(
+        "SELECT docs, total_length FROM search_stats WHERE id = 0"
+    ).fetchone()
+    if not terms or not docs:
+        return []
+    average_length: float = total_length / docs
+
+    marks: str = ", ".join("?" * len(terms))
+    frequencies: Dict[str, int] = dict(
+        conn.execute(
+            f"SELECT term, COUNT(*) FROM postings WHERE term IN ({marks}) "
+            "GROUP BY term",
+            terms,
+        ).fetchall()
+    )
+    if not frequencies:
+        return []
+    idf: Dict[str, float] = {
+        term: math.log(1 + (docs - count + 0.5) / (count + 0.5))
+        for term, count in frequencies.items()
+    }
+
+    # Scored in SQLite, reading only the postings of the query terms.
+    weights: str = " ".join("WHEN ? THEN ?" for _ in idf)
+    rows: List[sqlite3.Row] = conn.execute(
+        f"""
+        SELECT p.record, SUM(
+            (CASE p.term {weights} END) * p.tf * {K1 + 1}
+            / (p.tf + {K1} * (1 - {B} + {B} * d.length / ?))
+        ) AS score
+        FROM postings p JOIN search_docs d ON d.record = p.record
+        WHERE p.term IN ({", ".join("?" * len(idf))})
+        GROUP BY p.record
+        ORDER BY score DESC, p.record
+        LIMIT ?
+        """,
+        [x for item in idf.items() for x in item] + [average_length, *idf, limit],
+    ).fetchall()
+    return [(row[0], row[1]) for row in rows]
@@ -0,0 +1,87 @@
+"""
+Cold start report: imports the app in a fresh interpreter under python -X importtime,
+lists the slowest imports, and fails (exit 1) when startup is over budget or a
+dependency meant to be imported lazily was imported eagerly.
+Run from ac/, e.g. python startup_report.py --top 20
+"""
+from typing import List, Tuple
+from pathlib import Path
+import argparse
+import subprocess
+import sys
+import time
+
+# Seconds from interpreter start to a ready app, building the app and Control included.
+STARTUP_BUDGET: float = 1.5
+# Only needed by rarely used paths, so never imported on startup.
+LAZY_MODULES: List[str] = ["pandas", "plotly.express"]
+
+
+class StartupError(Exception):
+    pass
+
+
+def import_times(
+    module: str, folder: Path = Path(__file__).parent
+) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """
+    Wall time (in s) of importing module from folder in a new interpreter, and each
+    import it made as (name, self, cumulative), in microseconds. Raises StartupError
+    with the interpreter's error output if the import fails.
+    """
+    start: float = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=folder,
+        capture_output=True,
+        text=True,
+    )
+    wall: float = time.perf_counter() - start
+
+    imports: List[Tuple[str, int, int]] = []
+    errors: List[str] = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+        elif "self [us]" not in line:
+            self_us, cumulative_us, name = line[len("import time:") :].split("|")
+            imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    if process.returncode != 0:
+        raise StartupError(f"import {module} failed:\n" + "\n".join(errors))
+    return wall, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="app", help="Module to start.")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="Seconds.")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list.")
+    args = parser.parse_args()
+
+    try:
+        wall, imports = import_times(args.module)
+    except StartupError as error:
+        print(error)
+        sys.exit(1)
+    print(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module")
+    slowest = sorted(imports, key=lambda x: -x[2])[: args.top]
+    for name, self_us, cumulative_us in slowest:
+        print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}  {name}")
+
+    failures: List[str] = []
+    imported: List[str] = [name for name, _, _ in imports]
+    failures += [
+        f"{name} is imported on startup." for name in LAZY_MODULES if name in imported
+    ]
+    if wall > args.budget:
+        failures.append(
+            f"Startup took {wall:.2f} s, over the {args.budget:.2f} s budget."
+        )
+    print(f"\nStartup: {wall:.2f} s (budget {args.budget:.2f} s).")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
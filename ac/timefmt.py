@@ -0,0 +1,44 @@
+"""Parsing of the time ranges clips are cut at."""
+
+
+def formatter_lv1(singleTS):
+    tmpTS = []
+    try:
+        tmpTS = singleTS.split(":")
+    except:
+        raise ValueError("input error")
+    lenTmpTs = len(tmpTS)
+    totalmsec = 0
+    formatted_str = ""
+
+    if lenTmpTs == 3:
+        totalmsec += int(tmpTS[0]) * 60 * 1000 + int(tmpTS[1]) * 1000 + int(tmpTS[2])
+        formatted_str = "{:02d}:".format(int(tmpTS[0])) + "{:02d}".format(int(tmpTS[1]))
+    elif lenTmpTs == 2:
+        totalmsec += int(tmpTS[0]) * 60 * 1000 + int(tmpTS[1]) * 1000
+        formatted_str = "{:02d}:".format(int(tmpTS[0])) + "{:02d}".format(int(tmpTS[1]))
+    elif lenTmpTs == 1:
+        totalmsec += int(tmpTS[0]) * 1000
+        formatted_str = "00:" + "{:02d}".format(int(tmpTS[0]))
+
+    else:
+        raise ValueError("input error")
+
+    return totalmsec, formatted_str
+
+
+def formatter_lv0(time_string: str):
+    if len(time_string) > 50:
+        raise ValueError("too long")
+    tmpstr = []
+    try:
+        tmpstr = time_string.split("-")
+    except:
+        raise ValueError("""must include '-' """)
+    assert len(tmpstr) == 2
+
+    start, startstr = formatter_lv1(tmpstr[0])
+    end, endstr = formatter_lv1(tmpstr[1])
+    assert end > start
+
+    return start, end, startstr + "-" + endstr
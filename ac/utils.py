@@ -1,12 +1,14 @@
 """Helper function and small modules."""
 
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
+import re
 
 import plotly.graph_objects as go
-import plotly.express as px
 import numpy as np
 from pydub import AudioSegment
 
+from peaks import normalized_samples
+
 
 def timestamp_check(
     start_min: int,
@@ -37,6 +39,47 @@ def timestamp_check(
     return ""
 
 
+# Operators of DataTable filter queries, by the tokens typed in the filter row.
+TABLE_FILTER_OPERATORS: Dict[str, str] = {
+    **{token: token for token in ["eq", "ne", "lt", "le", "gt", "ge"]},
+    **{"=": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"},
+    "contains": "contains",
+    "datestartswith": "datestartswith",
+}
+# Operators whose unquoted values are compared as numbers when they look like one.
+NUMERIC_OPERATORS: List[str] = ["eq", "ne", "lt", "le", "gt", "ge"]
+# A filter query part: {column}, the operator token right after it, and the value.
+TABLE_FILTER_PART = re.compile(
+    r"\s*\{(?P<column>[^}]*)\}\s*(?P<token>[<>!=]+|\w+)\s*(?P<value>.*)", re.S
+)
+NUMBER = re.compile(r"-?\d+(\.\d+)?")
+
+
+def parse_table_filter(filter_query: str) -> List[Tuple[str, str, Any]]:
+    """
+    (column, operator, value) filters of a DataTable filter_query, for the record store.
+    Parts with an operator the store does not support are dropped.
+    """
+    filters: List[Tuple[str, str, Any]] = []
+    for part in filter_query.split(" && ") if filter_query else []:
+        match: Optional[re.Match] = TABLE_FILTER_PART.fullmatch(part)
+        if match is None or match["token"] not in TABLE_FILTER_OPERATORS:
+            continue
+        operator: str = TABLE_FILTER_OPERATORS[match["token"]]
+        value_part: str = match["value"].strip()
+        value: Any = value_part
+        if (
+            len(value_part) > 1
+            and value_part[0] == value_part[-1]
+            and value_part[0] in "'\"`"
+        ):
+            value = value_part[1:-1].replace("\\" + value_part[0], value_part[0])
+        elif operator in NUMERIC_OPERATORS and NUMBER.fullmatch(value_part):
+            value = float(value_part) if "." in value_part else int(value_part)
+        filters.append((match["column"], operator, value))
+    return filters
+
+
 def get_empty_figure(
     height: int = 180, width: int = 650, message: str = "Audio Preview Not Available"
 ):
@@ -58,18 +101,121 @@ def get_empty_figure(
     )
 
 
+def minmax_buckets(samples: np.ndarray, buckets: int) -> Tuple[np.ndarray, ...]:
+    """
+    Split frames (rows of samples) into at most buckets equal runs; returns the first
+    frame of each run and the min and max of each channel over it.
+    """
+    starts: np.ndarray = np.unique(
+        np.linspace(0, len(samples), min(buckets, len(samples)), endpoint=False).astype(
+            int
+        )
+    )
+    return (
+        starts,
+        np.minimum.reduceat(samples, starts, axis=0),
+        np.maximum.reduceat(samples, starts, axis=0),
+    )
+
+
+def preview_peaks(audio_obj: AudioSegment, width: int = 650) -> Dict[str, Any]:
+    """
+    What a wave plot of audio_obj draws: the min and max of each channel per pixel
+    column, the times of the columns and the duration, in ms.
+    """
+    samples: np.ndarray = normalized_samples(audio_obj)
+    if len(samples) == 0:
+        return {"time": [], "min": [], "max": [], "duration": 0}
+    starts, mins, maxs = minmax_buckets(samples, width)
+    return {
+        "time": starts * 1000 / audio_obj.frame_rate,
+        "min": mins,
+        "max": maxs,
+        "duration": len(audio_obj),
+    }
+
+
 def generate_preview(audio_obj: AudioSegment, height: int = 180, width: int = 650):
-    """Make a wave plot."""
-    samples: np.ndarray = np.array(audio_obj.get_array_of_samples())
-    fig = px.line(samples, y=0, render_mode="webgl")  # "y=0" disables legend.
-    fig.update_layout(
-        yaxis_title="",
-        yaxis_fixedrange=True,
-        xaxis_fixedrange=True,
+    """Make a wave plot, reduced to the min and max of each channel per pixel column."""
+    return plot_preview(preview_peaks(audio_obj, width), height=height, width=width)
+
+
+def plot_preview(peaks: Dict[str, Any], height: int = 180, width: int = 650):
+    """Make a wave plot from preview_peaks, or from their saved copy."""
+    if len(peaks["time"]) == 0:
+        return get_empty_figure(height=height, width=width)
+    mins: np.ndarray = np.asarray(peaks["min"])
+    maxs: np.ndarray = np.asarray(peaks["max"])
+    # Each column is drawn as a stroke from its min to its max.
+    time: np.ndarray = np.repeat(peaks["time"], 2)
+    fig = go.Figure(
+        [
+            go.Scatter(
+                x=time,
+                y=np.column_stack([mins[:, channel], maxs[:, channel]]).ravel(),
+                mode="lines",
+                line={"width": 1},
+                name=f"channel {channel + 1}",
+                hoverinfo="x",
+                showlegend=False,
+            )
+            for channel in range(mins.shape[1])
+        ]
     )
-    # X-axis label.
-    fig.update_xaxes(
-        title="milliseconds",
+    return (
+        fig.update_layout(
+            plot_bgcolor="white",
+            margin=dict(t=0, l=5, b=0, r=5),
+            height=height,
+            width=width,
+        )
+        .update_xaxes(
+            title="milliseconds",
+            fixedrange=True,
+            linecolor="lightgrey",
+            gridcolor="lightgrey",
+        )
+        .update_yaxes(
+            range=[-1, 1],
+            fixedrange=True,
+            mirror=True,
+            linecolor="lightgrey",
+            gridcolor="lightgrey",
+        )
+    )
+
+
+def generate_overview(
+    peaks: Dict[str, np.ndarray],
+    height: int = 180,
+    width: int = 650,
+    uirevision: str = "",
+):
+    """
+    Draw min/max and RMS envelopes from a waveform pyramid range (see peaks.peak_range).
+    uirevision keeps the user's zoom while the data under it is swapped.
+    """
+    time: np.ndarray = peaks["time"]
+    envelope = dict(mode="lines", line={"width": 0}, hoverinfo="skip", showlegend=False)
+    fig = go.Figure(
+        [
+            go.Scatter(x=time, y=peaks["max"], **envelope),
+            go.Scatter(
+                x=time,
+                y=peaks["min"],
+                fill="tonexty",
+                fillcolor="rgba(99, 110, 250, 0.5)",
+                **envelope,
+            ),
+            go.Scatter(x=time, y=peaks["rms"], **envelope),
+            go.Scatter(
+                x=time,
+                y=-peaks["rms"],
+                fill="tonexty",
+                fillcolor="rgba(99, 110, 250, 0.9)",
+                **envelope,
+            ),
+        ]
     )
     return (
         fig.update_layout(
@@ -77,9 +223,17 @@ def generate_preview(audio_obj: AudioSegment, height: int = 180, width: int = 65
             margin=dict(t=0, l=5, b=0, r=5),
             height=height,
             width=width,
+            uirevision=uirevision,
+            dragmode="pan",  # Zoomed with the scroll wheel.
         )
         .update_xaxes(
             title="milliseconds", linecolor="lightgrey", gridcolor="lightgrey"
         )
-        .update_yaxes(mirror=True, linecolor="lightgrey", gridcolor="lightgrey")
+        .update_yaxes(
+            range=[-1, 1],
+            fixedrange=True,
+            mirror=True,
+            linecolor="lightgrey",
+            gridcolor="lightgrey",
+        )
     )
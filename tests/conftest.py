@@ -0,0 +1,6 @@
+"""The app's modules import each other from the ac folder, as when run from it."""
+
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath("ac")))
@@ -0,0 +1,66 @@
+from pydub import AudioSegment
+
+from chunk_cache import ChunkCache
+
+
+def chunk(ms):
+    # 16 bytes per ms: 8 kHz, 16 bit mono.
+    return AudioSegment.silent(duration=ms, frame_rate=8000)
+
+
+def test_evicts_least_recent():
+    cache = ChunkCache(max_bytes=3 * len(chunk(10).raw_data))
+    for key in "abc":
+        cache.put(key, chunk(10))
+    # Looking a up makes b the least recent; membership tests do not count.
+    assert cache.get("a") is not None
+    assert "b" in cache
+    cache.put("d", chunk(10))
+    assert [key in cache for key in "abcd"] == [True, False, True, True]
+    cache.put("e", chunk(10))
+    assert [key in cache for key in "acde"] == [True, False, True, True]
+
+
+def test_size_bound():
+    cache = ChunkCache(max_bytes=len(chunk(30).raw_data))
+    cache.put("a", chunk(10))
+    cache.put("b", chunk(10))
+    # Replacing an entry counts its new size only.
+    cache.put("a", chunk(20))
+    assert cache.stats()["bytes"] == len(chunk(30).raw_data)
+    cache.put("c", chunk(20))
+    assert (cache.stats()["entries"], cache.stats()["evictions"]) == (1, 2)
+    # Chunks larger than the whole cache are not kept, nor evict anything.
+    cache.put("d", chunk(40))
+    assert "d" not in cache and "c" in cache
+
+
+def test_counters():
+    cache = ChunkCache(max_bytes=2 * len(chunk(10).raw_data))
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return chunk(10)
+
+    for key in "aabca":
+        cache.get_or_load(key, loader)
+    assert len(loads) == 4
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 4,
+        "evictions": 2,
+        "entries": 2,
+        "bytes": 2 * len(chunk(10).raw_data),
+    }
+
+    cache.clear()
+    assert cache.stats() == {
+        "hits": 0,
+        "misses": 0,
+        "evictions": 0,
+        "entries": 0,
+        "bytes": 0,
+    }
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from constants import SPLIT_INTERVAL
+from cutter import chunk_slice
+
+
+def synthetic_chunks(frame_rate, channels, count=4, last_ms=7321):
+    rng = np.random.default_rng(frame_rate + channels)
+    chunks = []
+    for index in range(count):
+        ms = last_ms if index == count - 1 else SPLIT_INTERVAL
+        samples = rng.integers(-(2**15), 2**15, ms * frame_rate // 1000 * channels)
+        chunks.append(
+            AudioSegment(
+                data=samples.astype(np.int16).tobytes(),
+                sample_width=2,
+                frame_rate=frame_rate,
+                channels=channels,
+            )
+        )
+    return chunks
+
+
+def loop_slice(start, end, chunks):
+    """The cut as it was made before, growing it one chunk at a time."""
+    start_file, start_point = divmod(start, SPLIT_INTERVAL)
+    end_file, end_point = divmod(end, SPLIT_INTERVAL)
+    sound = chunks[start_file]
+    if start_file == end_file:
+        return sound[start_point : end_point + 1]
+    sound = sound[start_point:]
+    for index in range(start_file + 1, end_file + 1):
+        temp = chunks[index]
+        if index == end_file:
+            temp = temp[:end_point]
+        sound += temp
+    return sound
+
+
+@pytest.mark.parametrize("frame_rate, channels", [(44100, 2), (22050, 1), (8000, 1)])
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        (1234, 4567),
+        (0, SPLIT_INTERVAL - 1),
+        # Across one boundary, ending on or just after it.
+        (SPLIT_INTERVAL - 1500, SPLIT_INTERVAL + 1500),
+        (SPLIT_INTERVAL - 1, SPLIT_INTERVAL),
+        (SPLIT_INTERVAL - 1500, 2 * SPLIT_INTERVAL),
+        # Across several, into the shorter last chunk and past its end.
+        (333, 2 * SPLIT_INTERVAL + 777),
+        (SPLIT_INTERVAL + 5, 3 * SPLIT_INTERVAL + 7000),
+        (2 * SPLIT_INTERVAL + 19999, 3 * SPLIT_INTERVAL + 9000),
+    ],
+)
+def test_chunk_slice_matches_loop(tmp_path, frame_rate, channels, start, end):
+    chunks = synthetic_chunks(frame_rate, channels)
+    cut = chunk_slice(start, end, "synthetic", tmp_path, load=chunks.__getitem__)
+    expected = loop_slice(start, end, chunks)
+    assert cut.raw_data == expected.raw_data
+    assert (cut.frame_rate, cut.channels, cut.sample_width) == (
+        expected.frame_rate,
+        expected.channels,
+        expected.sample_width,
+    )
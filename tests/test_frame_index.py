@@ -0,0 +1,93 @@
+import io
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+import frame_index
+from constants import CHUNK_CODEC
+from frame_index import audio_path, build_index, copy_frames, index_slice, load_index
+
+FRAME_RATE = 44100
+
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    """A ten second tone, indexed, and its samples as players decode them."""
+    folder = tmp_path_factory.mktemp("processed")
+    tone = Sine(440).to_audio_segment(duration=10000).set_frame_rate(FRAME_RATE)
+    tone.export(
+        audio_path("tone", folder), format="mp3", bitrate=CHUNK_CODEC["bitrate"]
+    )
+    build_index("tone", folder)
+    return folder, AudioSegment.from_file(audio_path("tone", folder))
+
+
+def samples(sound):
+    return np.array(sound.get_array_of_samples(), dtype=float)
+
+
+def expected(decoded, start, end):
+    return decoded.get_sample_slice(
+        start * FRAME_RATE // 1000, (end + 1) * FRAME_RATE // 1000
+    )
+
+
+def test_index(source):
+    folder, decoded = source
+    index = load_index("tone", folder)
+    frames = len(index["timestamps"])
+    assert len(index["offsets"]) == frames + 1
+    assert (int(index["frame_rate"]), int(index["channels"])) == (FRAME_RATE, 1)
+    # The encoder delay is dropped in front, the padding of the last frame at the end.
+    assert int(index["timestamps"][0]) == -int(index["skip"]) < 0
+    spf = int(index["samples_per_frame"])
+    assert (frames - 1) * spf < decoded.frame_count() + index["skip"] <= frames * spf
+    assert not list(folder.glob("*.part"))
+
+
+@pytest.mark.parametrize("start, end", [(0, 999), (1234, 4567), (5000, 9999)])
+def test_index_slice(source, start, end):
+    folder, decoded = source
+    cut = index_slice(start, end, "tone", folder)
+    reference = expected(decoded, start, end)
+    assert cut.frame_count() == reference.frame_count()
+    # Decoding from the middle of the stream only differs by rounding.
+    assert np.abs(samples(cut) - samples(reference)).max() <= 1
+
+
+@pytest.mark.parametrize("start, end", [(0, 999), (1234, 4567), (5000, 9999)])
+def test_copy_frames(source, start, end):
+    folder, decoded = source
+    clip = copy_frames(start, end, "tone", folder)
+    assert clip is not None
+    # Players trim the delay and padding of its Info frame to the exact range.
+    cut = AudioSegment.from_file(io.BytesIO(clip), format="mp3")
+    reference = expected(decoded, start, end)
+    assert cut.frame_count() == reference.frame_count()
+    assert np.array_equal(samples(cut), samples(reference))
+
+
+def test_encode_source(tmp_path, monkeypatch):
+    monkeypatch.setattr(frame_index, "ASSET_FOLDER", tmp_path)
+    Sine(440).to_audio_segment(duration=3000).export(
+        tmp_path.joinpath("tone_audio.m4a"), format="ipod"
+    )
+    folder = tmp_path.joinpath("processed")
+    folder.mkdir()
+    frame_index.encode_source("tone_audio.m4a", folder)
+    build_index("tone_audio.m4a", folder)
+    assert sorted(path.name for path in folder.iterdir()) == [
+        "tone_audio.m4a.frames.npz",
+        "tone_audio.m4a.mp3",
+    ]
+    assert abs(len(index_slice(0, 2999, "tone_audio.m4a", folder)) - 3000) <= 1
+
+    # A failed run leaves the previous encode in place.
+    before = audio_path("tone_audio.m4a", folder).read_bytes()
+    tmp_path.joinpath("tone_audio.m4a").write_bytes(b"not audio")
+    with pytest.raises(RuntimeError):
+        frame_index.encode_source("tone_audio.m4a", folder)
+    assert audio_path("tone_audio.m4a", folder).read_bytes() == before
+    assert len(list(folder.iterdir())) == 2
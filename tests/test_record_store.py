@@ -0,0 +1,111 @@
+import sqlite3
+
+import pytest
+
+from record_store import DEFAULT_COLS, RecordStore
+
+
+def entry(title, quote="a quote", source="2012", time="0:1:0-0:2:500"):
+    return {
+        "Title": title,
+        "Quotes": quote,
+        "Source": source,
+        "Length": "      1.50s",
+        "Edits": 0,
+        "Time": time,
+        "Submission": "01/10/2019 18:32:10",
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RecordStore(tmp_path.joinpath("records.sqlite3"))
+
+
+def test_migration(tmp_path, store):
+    records_csv = tmp_path.joinpath("records.csv")
+    records_csv.write_text(
+        "," + ",".join(DEFAULT_COLS) + "\n"
+        "0,0,first,one,2011,      3.00s,,23:08-23:11,01/10/2019 18:11:19\n"
+        "1,5,second,two,2012,      4.00s,1,01:30-01:34,01/10/2019 18:32:10\n"
+    )
+    legacy_export = tmp_path.joinpath("export.csv")
+    legacy_export.write_text(
+        "Index\tQuotes\tTime\tLength\tSubmission\tDownload\tSource\n"
+        "1\tthree\t00:10-00:12\t      2.00s\t01/11/2019 10:00:00\t"
+        "http://host/00_10-00_12_2012.mp3\t2012\n"
+    )
+    store.migrate(records_csv, legacy_export)
+
+    assert [store.get(index).title for index in [0, 5, 6]] == [
+        "first",
+        "second",
+        "00_10-00_12",
+    ]
+    assert store.get(0).edits == 0
+    assert (store.get(5).start_ms, store.get(5).end_ms) == (90000, 94000)
+    assert store.get(6).source == "2012"
+    assert [record.index for record in store.search("three")] == [6]
+
+    # Done once: later runs leave the store alone.
+    records_csv.unlink()
+    store.add(entry("new"))
+    store.migrate(records_csv, legacy_export)
+    assert store.page(0, 10)[1] == 4
+
+
+def test_add_numbering(tmp_path, store):
+    assert [store.add(entry(f"clip{n}")) for n in range(3)] == [0, 1, 2]
+    # A reopened store carries on after the last index.
+    reopened = RecordStore(tmp_path.joinpath("records.sqlite3"))
+    assert reopened.add(entry("clip3")) == 3
+    assert store.get(3).title == "clip3"
+
+
+def test_page(store):
+    for n, source in enumerate(["2012", "2011", "2012", "2013", "2012"]):
+        store.add(entry(f"clip{n}", quote=f"quote 10{n}%", source=source))
+
+    rows, count = store.page(0, 2, sort_by=[("Source", False)])
+    assert count == 5
+    assert [row["Index"] for row in rows] == [3, 0]
+    rows, _ = store.page(2, 2, sort_by=[("Source", False)])
+    assert [row["Index"] for row in rows] == [2, 4]
+
+    rows, count = store.page(
+        0, 10, filters=[("Source", "eq", "2012"), ("Index", "gt", 0)]
+    )
+    assert (count, [row["Index"] for row in rows]) == (2, [2, 4])
+    # Wildcards in a contains value are matched literally.
+    rows, count = store.page(0, 10, filters=[("Quotes", "contains", "103%")])
+    assert (count, [row["Index"] for row in rows]) == (1, [3])
+    rows, count = store.page(0, 10, filters=[("Quotes", "contains", "10_")])
+    assert count == 0
+    assert list(rows) == []
+
+    with pytest.raises(ValueError):
+        store.page(0, 10, filters=[("start_ms", "eq", 0)])
+    with pytest.raises(ValueError):
+        store.page(0, 10, sort_by=[("Index; DROP TABLE records", True)])
+
+
+def test_time_columns_backfilled(tmp_path):
+    path = tmp_path.joinpath("records.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE records ("Index" INTEGER PRIMARY KEY, Title TEXT NOT NULL, '
+        "Quotes TEXT NOT NULL, Source TEXT NOT NULL, Length TEXT NOT NULL, "
+        "Edits INTEGER NOT NULL DEFAULT 0, Time TEXT NOT NULL, "
+        "Submission TEXT NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO records VALUES (4, 'old', 'quote', '2012', '      3.00s', 0, "
+        "'1:2:0-1:5:0', '01/10/2019 18:32:10')"
+    )
+    conn.commit()
+    conn.close()
+
+    store = RecordStore(path)
+    assert (store.get(4).start_ms, store.get(4).end_ms) == (62000, 65000)
+    # Opening it again finds the columns in place.
+    assert RecordStore(path).get(4).end_ms == 65000
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from constants import MANIFEST_SUFFIX
+from record_store import RecordStore
+from runtime_manager import Control, InvalidEntryError
+
+PENDING = {
+    "Source": "2012",
+    "Time": "0:1:0-0:2:500",
+    "Title": "title",
+    "Quotes": "quote",
+}
+
+
+def test_checked_entry_rebuilds_record():
+    forged = dict(PENDING, Length="99.99s", Submission="yesterday", Edits=7)
+    entry = Control.checked_entry(forged)
+    assert entry["Length"] == Control.checked_entry(PENDING)["Length"] != "99.99s"
+    assert entry["Submission"] != "yesterday"
+    assert entry["Edits"] == 0
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"Source": None},
+        {"Source": "../2012"},
+        {"Title": "../../app"},
+        {"Title": "a\0b"},
+        {"Quotes": "two\nlines"},
+        {"Time": "0:2:0-0:1:0"},
+        {"Time": "soon"},
+        {"Time": 5},
+    ],
+)
+def test_checked_entry_rejects(changes):
+    with pytest.raises(InvalidEntryError):
+        Control.checked_entry(dict(PENDING, **changes))
+
+
+def test_checked_entry_rejects_missing_field():
+    with pytest.raises(InvalidEntryError):
+        Control.checked_entry({"Source": "2012"})
+
+
+def control(parent):
+    record_db = parent.joinpath("records.sqlite3")
+    # Nothing to import: marks the store as migrated.
+    RecordStore(record_db).migrate(parent.joinpath("none"), parent.joinpath("none"))
+    return Control(parent=parent, record_db=record_db)
+
+
+@pytest.mark.parametrize(
+    "files, complete",
+    [
+        ([], False),
+        (["2012_audio.m4a_0_20000.mp3"], True),
+        # A run still going (or interrupted) is not a processed source.
+        (["2012_audio.m4a_0_20000.mp3", "2012_audio.m4a" + MANIFEST_SUFFIX], False),
+        (["2012_audio.m4a.mp3", "2012_audio.m4a" + MANIFEST_SUFFIX], False),
+        # Unless another source was processed before manifests existed.
+        (
+            ["2012_audio.m4a.mp3", "2012_audio.m4a" + MANIFEST_SUFFIX]
+            + ["2011_audio.m4a_0_20000.mp3"],
+            True,
+        ),
+    ],
+)
+def test_check_folders(tmp_path, files, complete):
+    processed = tmp_path.joinpath("assets/processed")
+    processed.mkdir(parents=True)
+    for name in files:
+        data = json.dumps({"source": name, "complete": False})
+        processed.joinpath(name).write_text(data)
+    if complete:
+        control(tmp_path)
+    else:
+        with pytest.raises(FileNotFoundError):
+            control(tmp_path)
+
+
+def test_check_folders_complete_manifest(tmp_path):
+    processed = tmp_path.joinpath("assets/processed")
+    processed.mkdir(parents=True)
+    manifest = {"source": "2012_audio.m4a", "complete": True}
+    processed.joinpath("2012_audio.m4a" + MANIFEST_SUFFIX).write_text(
+        json.dumps(manifest)
+    )
+    control(tmp_path)
+    assert tmp_path.joinpath("assets/saves").is_dir()
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+import search_index
+from search_index import index_record, search, tokenize
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("", []),
+        ("What is R?", ["what", "is", "r"]),
+        ("Room 101, floor 3", ["room", "101", "floor", "3"]),
+        ("知识", ["知", "识", "知识"]),
+        ("知识库", ["知", "识", "库", "知识", "识库"]),
+        # Runs split at latin words and punctuation.
+        ("R语言, 好的", ["r", "语", "言", "语言", "好", "的", "好的"]),
+        ("用 Dash 做", ["用", "dash", "做"]),
+    ],
+)
+def test_tokenize(text, expected):
+    assert tokenize(text) == expected
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(search_index.SCHEMA)
+    return conn
+
+
+def ranked(conn, query, limit=10):
+    return [record for record, _ in search(conn, query, limit)]
+
+
+def test_ranking(conn):
+    index_record(conn, 0, "intro", "the knowledge base is a base of knowledge")
+    index_record(conn, 1, "knowledge", "where it all starts")
+    index_record(conn, 2, "notes", "a knowledge base")
+    index_record(conn, 3, "notes", "nothing to see here, just some longer filler text")
+
+    # A title term outweighs the same term in the quote; shorter quotes rank higher.
+    assert ranked(conn, "knowledge") == [1, 0, 2]
+    # Rarer terms count for more.
+    assert ranked(conn, "base knowledge") == [0, 2, 1]
+    assert ranked(conn, "base knowledge", limit=1) == [0]
+    assert ranked(conn, "filler") == [3]
+    assert ranked(conn, "absent") == []
+    assert ranked(conn, "?!") == []
+
+
+def test_ranking_cjk(conn):
+    index_record(conn, 0, "t", "知识库")
+    index_record(conn, 1, "t", "知道 识别")
+    # Both hold 知 and 识, but only one the word.
+    assert ranked(conn, "知识") == [0, 1]
+    assert ranked(conn, "识别") == [1, 0]
+
+
+def test_empty_index(conn):
+    assert ranked(conn, "knowledge") == []
@@ -0,0 +1,55 @@
+from pathlib import Path
+import shutil
+
+from pydub.generators import Sine
+import pytest
+
+from constants import CHUNK_CODEC
+from manifest import new_manifest, save_manifest
+from record_store import RecordStore
+from startup_report import LAZY_MODULES, StartupError, import_times
+
+AC_FOLDER: Path = Path(__file__).parent.parent.joinpath("ac")
+
+
+@pytest.fixture
+def app_folder(tmp_path):
+    """
+    A copy of the app whose assets hold one processed source and a migrated store, so
+    starting it leaves the real assets alone.
+    """
+    folder = tmp_path.joinpath("ac")
+    folder.mkdir()
+    for path in AC_FOLDER.glob("*.py"):
+        shutil.copy(path, folder)
+    processed = folder.joinpath("assets/processed")
+    processed.mkdir(parents=True)
+    Sine(440).to_audio_segment(duration=1000).export(
+        processed.joinpath("2012_audio.m4a_0_20000.mp3"), **CHUNK_CODEC
+    )
+    manifest = new_manifest(
+        "2012_audio.m4a",
+        content_hash="",
+        layout="mp3",
+        duration=1000,
+        chunk_count=1,
+        split_interval=20000,
+    )
+    manifest["complete"] = True
+    save_manifest(manifest, processed)
+    RecordStore(folder.joinpath("assets/records.sqlite3")).migrate(
+        tmp_path.joinpath("none"), tmp_path.joinpath("none")
+    )
+    return folder
+
+
+def test_app_startup(app_folder):
+    _, imports = import_times("app", app_folder)
+    imported = [name for name, _, _ in imports]
+    assert "app" in imported
+    assert [name for name in LAZY_MODULES if name in imported] == []
+
+
+def test_failed_import_shows_error():
+    with pytest.raises(StartupError, match="No module named 'no_such_module'"):
+        import_times("no_such_module")
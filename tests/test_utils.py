@@ -0,0 +1,70 @@
+import pytest
+
+from utils import parse_table_filter
+
+
+@pytest.mark.parametrize(
+    "filter_query, expected",
+    [
+        ("", []),
+        ("{Index} >= 5", [("Index", "ge", 5)]),
+        ("{Index} ge 5", [("Index", "ge", 5)]),
+        ("{Index} < 2.5", [("Index", "lt", 2.5)]),
+        ("{Index} != -3", [("Index", "ne", -3)]),
+        (
+            "{Index} = 7 && {Source} = 2012",
+            [("Index", "eq", 7), ("Source", "eq", 2012)],
+        ),
+        (
+            "{Submission} datestartswith 2023-08",
+            [("Submission", "datestartswith", "2023-08")],
+        ),
+    ],
+)
+def test_operators(filter_query, expected):
+    assert parse_table_filter(filter_query) == expected
+
+
+@pytest.mark.parametrize(
+    "filter_query, expected",
+    [
+        # Operator tokens inside the value are part of it.
+        (
+            '{Quotes} contains "knowledge base"',
+            [("Quotes", "contains", "knowledge base")],
+        ),
+        ('{Quotes} contains "single one"', [("Quotes", "contains", "single one")]),
+        ('{Quotes} contains "a < b"', [("Quotes", "contains", "a < b")]),
+        ("{Title} contains x>=y", [("Title", "contains", "x>=y")]),
+        ('{Title} = "it\\"s"', [("Title", "eq", 'it"s')]),
+    ],
+)
+def test_operator_in_value(filter_query, expected):
+    assert parse_table_filter(filter_query) == expected
+
+
+@pytest.mark.parametrize(
+    "filter_query, expected",
+    [
+        # Text operators keep their values as typed.
+        ("{Title} contains 23_08", [("Title", "contains", "23_08")]),
+        ("{Title} contains 2308", [("Title", "contains", "2308")]),
+        (
+            "{Submission} datestartswith 2023",
+            [("Submission", "datestartswith", "2023")],
+        ),
+        # Comparisons only take plain numbers as numbers.
+        ("{Index} = 23_08", [("Index", "eq", "23_08")]),
+        ("{Index} = 1e3", [("Index", "eq", "1e3")]),
+        ("{Index} = nan", [("Index", "eq", "nan")]),
+        ('{Index} = "5"', [("Index", "eq", "5")]),
+    ],
+)
+def test_value_types(filter_query, expected):
+    assert parse_table_filter(filter_query) == expected
+
+
+def test_unsupported_parts_dropped():
+    assert parse_table_filter("{Title} icontains a && {Index} > 1") == [
+        ("Index", "gt", 1)
+    ]